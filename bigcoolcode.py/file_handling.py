@@ -1,3 +1,15 @@
+import hashlib
+import json
+import os
+
+# Documents are counted in chunks of about this many bytes (each chunk
+# ends at a line break). The count for each chunk is cached next to the
+# document, so after a change only the chunks that changed are counted.
+CHUNK_SIZE = 1024 * 1024
+
+# The cache for a document is kept in the document's name + this
+CACHE_SUFFIX = ".wordcount"
+
 def read_file(filename):
     """Reads the content from a file"""
     try:
@@ -14,12 +26,16 @@ def clean_content(content):
     
     for line in lines:
         # Skip the word count and timestamp lines
-        if not line.startswith("Word Count:") and not line.startswith("Last Updated:"):
+        if not is_info_line(line):
             if line.strip():  # Only add non-empty lines
                 clean_lines.append(line)
     
     return '\n'.join(clean_lines)
 
+def is_info_line(line):
+    """True for the word count and timestamp lines we add to documents"""
+    return line.startswith("Word Count:") or line.startswith("Last Updated:")
+
 def count_words(text):
     """Counts the words in the text"""
     # First remove any existing word count and timestamp lines
@@ -29,21 +45,198 @@ def count_words(text):
 
 def update_file_info(filename, word_count, timestamp):
     """Updates the file with word count and timestamp"""
-    content = clean_content(read_file(filename))
-    
-    # Add word count and timestamp at the bottom
-    with open(filename, 'w') as file:
-        if content:
-            file.write(content + "\n\n")
-        file.write(f"Word Count: {word_count}\n")
-        file.write(f"Last Updated: {timestamp}")
-
-def append_to_file(filename, new_content):
-    """Adds new content to the file"""
-    current_content = clean_content(read_file(filename))
-    
-    with open(filename, 'w') as file:
-        if current_content:
-            file.write(current_content + "\n" + new_content + "\n\n")
-        else:
-            file.write(new_content + "\n\n")
+    write_ending(filename, "", word_count, timestamp)
+
+def append_to_file(filename, new_content, timestamp):
+    """Adds new content to the file, with a new word count and timestamp
+    after it, and returns the new word count"""
+    # The old word count and timestamp lines have no words, so the count
+    # up to them is the count for the whole file
+    word_count = count_file_words(filename) + count_chunk(new_content.encode('utf-8'))
+    write_ending(filename, new_content + "\n", word_count, timestamp)
+    return word_count
+
+def write_ending(filename, text, word_count, timestamp):
+    """Replaces the word count and timestamp lines at the end of the file
+    with text and new word count and timestamp lines
+
+    The file is only cut off where the old lines start and added to, the
+    rest of it is never rewritten, so a crash can't lose any of it.
+    """
+    if not os.path.exists(filename):
+        print("File not found. Creating new file.")
+        open(filename, 'wb').close()
+    
+    # Makes sure the word count cache is up to date, so afterwards only
+    # the end of the file needs counting again
+    count_file_words(filename)
+    
+    with open(filename, 'r+b') as file:
+        start = find_ending(file)
+        
+        ending = ""
+        if start:
+            file.seek(start - 1)
+            if file.read(1) != b'\n':
+                ending += "\n"
+        if start or text:
+            # Keep a blank line between the content and the word count
+            ending += text + "\n"
+        ending += f"Word Count: {word_count}\n"
+        ending += f"Last Updated: {timestamp}"
+        
+        file.seek(start)
+        file.truncate()
+        file.write(ending.encode('utf-8'))
+    
+    recount_from(filename, start)
+
+def find_ending(file):
+    """Where the word count and timestamp lines (and blank lines) at the end
+    of a file opened in binary mode start (the file size if there aren't any)
+
+    Only reads the end of the file.
+    """
+    size = file.seek(0, os.SEEK_END)
+    amount = 4096
+    while True:
+        begin = max(0, size - amount)
+        file.seek(begin)
+        lines = file.read(size - begin).split(b'\n')
+        if begin:
+            # The first line may have started before what we read
+            lines = lines[1:]
+        
+        end = size
+        for line in reversed(lines):
+            # A lone \r is a line break too when reading as text
+            parts = line.decode('utf-8', errors='replace').split('\r')
+            if any(part.strip() and not is_info_line(part) for part in parts):
+                # Keep this line and its line break
+                return min(end + 1, size)
+            end -= len(line) + 1
+        
+        if not begin:
+            return 0
+        # It's all word count and blank lines so far, so look further back
+        amount *= 2
+
+def count_chunk(data):
+    """Counts the words in part of a document (bytes), the same way
+    count_words does"""
+    # Same line endings as reading the file as text
+    text = data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+    count = 0
+    for line in text.split('\n'):
+        if not is_info_line(line):
+            count += len(line.split())
+    return count
+
+def read_chunks(file):
+    """Reads a file opened in binary mode in chunks of about CHUNK_SIZE
+    bytes, each ending at a line break, and yields (offset, chunk)"""
+    offset = file.tell()
+    while True:
+        data = file.read(CHUNK_SIZE)
+        if not data:
+            return
+        # Finish the line, so a line (or a word) is never split between chunks
+        if not data.endswith(b'\n'):
+            data += file.readline()
+        yield offset, data
+        offset += len(data)
+
+def load_word_cache(filename):
+    """Loads the cached chunk counts for a document (None if there aren't any)"""
+    try:
+        with open(filename + CACHE_SUFFIX, 'r') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return None
+    
+    # Chunks from a different chunk size don't line up with ours
+    if not isinstance(cache, dict) or cache.get('chunk_size') != CHUNK_SIZE:
+        return None
+    return cache
+
+def save_word_cache(filename, chunks):
+    """Saves chunk counts [offset, length, hash, words] for a document,
+    along with its current size and modified time"""
+    info = os.stat(filename)
+    cache = {
+        'chunk_size': CHUNK_SIZE,
+        'size': info.st_size,
+        'mtime': info.st_mtime_ns,
+        'chunks': chunks,
+    }
+    temp_name = filename + CACHE_SUFFIX + ".tmp"
+    try:
+        with open(temp_name, 'w') as file:
+            json.dump(cache, file)
+        os.replace(temp_name, filename + CACHE_SUFFIX)
+    except OSError:
+        # The cache only saves time, so counting still works without it
+        pass
+
+def count_file_words(filename):
+    """Counts the words in a document file, like count_words(read_file(filename))
+
+    If the file hasn't changed since the last count, the cached total is
+    used without reading it. Otherwise each chunk is hashed, and only the
+    chunks whose offset and hash aren't in the cache (an added or changed
+    tail, or an edited chunk) are counted again, since hashing is much
+    faster than counting.
+    """
+    if not os.path.exists(filename):
+        return 0
+    
+    cache = load_word_cache(filename)
+    if cache is not None:
+        info = os.stat(filename)
+        if cache['size'] == info.st_size and cache['mtime'] == info.st_mtime_ns:
+            return sum(chunk[3] for chunk in cache['chunks'])
+    
+    cached = {}
+    if cache is not None:
+        for offset, length, digest, words in cache['chunks']:
+            cached[offset] = (length, digest, words)
+    
+    chunks = []
+    with open(filename, 'rb') as file:
+        for offset, data in read_chunks(file):
+            digest = hashlib.sha1(data).hexdigest()
+            old = cached.get(offset)
+            if old is not None and old[0] == len(data) and old[1] == digest:
+                words = old[2]
+            else:
+                words = count_chunk(data)
+            chunks.append([offset, len(data), digest, words])
+    
+    save_word_cache(filename, chunks)
+    return sum(chunk[3] for chunk in chunks)
+
+def recount_from(filename, offset):
+    """Updates the word count cache after the file changed from offset on
+    (the cache must have been up to date before the change)"""
+    cache = load_word_cache(filename)
+    if cache is None:
+        count_file_words(filename)
+        return
+    
+    # Keep the chunks before offset, except one that ran to the old end of
+    # the file (it may not have ended with a line break, and then more was
+    # added to its last line)
+    chunks = []
+    for chunk in cache['chunks']:
+        chunk_end = chunk[0] + chunk[1]
+        if chunk_end > offset or chunk_end >= cache['size']:
+            break
+        chunks.append(chunk)
+    
+    with open(filename, 'rb') as file:
+        if chunks:
+            file.seek(chunks[-1][0] + chunks[-1][1])
+        for chunk_offset, data in read_chunks(file):
+            chunks.append([chunk_offset, len(data), hashlib.sha1(data).hexdigest(), count_chunk(data)])
+    
+    save_word_cache(filename, chunks)
@@ -0,0 +1,153 @@
+#DU P1 Larose PERSONAL LIBRARY / library_io.py
+# Bulk import and export for library_manager.py (CSV or JSONL files)
+
+import csv
+import json
+import sys
+import time
+
+from library_item import FIELDS, MAX_RATING, MIN_RATING, Item, parse_rating, parse_year, text
+
+# Items are read, checked and added this many at a time, so importing
+# never holds more than one batch in memory
+IMPORT_BATCH = 5000
+
+def file_format(filename):
+    """'jsonl' for .jsonl/.json files, otherwise 'csv'"""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.json')) else 'csv'
+
+def read_records(filename):
+    """Yield (line number, row dict, problem) from a CSV or JSONL file
+
+    A JSONL line that isn't a JSON object comes back with row None and the
+    problem, so it can be reported instead of stopping the import.
+    """
+    with open(filename, 'r', newline='', encoding='utf-8') as file:
+        if file_format(filename) == 'csv':
+            # Any CSV with a header works, including other library files
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row, None
+        else:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield number, None, "not valid JSON"
+                    continue
+                if isinstance(row, dict):
+                    yield number, row, None
+                else:
+                    yield number, None, "not a JSON object"
+
+def clean_batch(rows):
+    """Check and tidy a batch of rows
+
+    Each column is converted in one pass over the batch, then rows are
+    put back together. Returns (items, [(index in rows, reason)] for the
+    rows that were rejected).
+    """
+    titles = [text(row.get('title')) for row in rows]
+    creators = [text(row.get('creator')) for row in rows]
+    years = [parse_year(row.get('year')) for row in rows]
+    ratings = [parse_rating(row.get('rating')) for row in rows]
+    genres = [sys.intern(text(row.get('genre'))) for row in rows]
+    formats = [sys.intern(text(row.get('format'))) for row in rows]
+    notes = [text(row.get('notes')) for row in rows]
+
+    items = []
+    rejected = []
+    for i, row in enumerate(rows):
+        if not titles[i]:
+            rejected.append((i, "missing title"))
+        elif not creators[i]:
+            rejected.append((i, "missing creator"))
+        elif years[i] is None:
+            rejected.append((i, f"year is not a whole number: {row.get('year')!r}"))
+        elif ratings[i] is None:
+            rejected.append((i, f"rating is not {MIN_RATING}-{MAX_RATING}: {row.get('rating')!r}"))
+        else:
+            item = Item()
+            item.title = titles[i]
+            item.creator = creators[i]
+            item.year = years[i]
+            item.genre = genres[i]
+            item.format = formats[i]
+            item.rating = ratings[i]
+            item.notes = notes[i]
+            items.append(item)
+    return items, rejected
+
+def item_key(item):
+    """What makes two items the same for import: title and creator"""
+    return (text(item.get('title')).lower(), text(item.get('creator')).lower())
+
+def import_file(library, filename, rejects_file=None, batch_size=IMPORT_BATCH):
+    """Add every new, valid item in filename to library
+
+    Items whose (title, creator) is already in the library (or earlier in
+    the file) are skipped. Rejected rows are written to rejects_file as
+    JSONL with the reason. Returns a dict of counts and timings.
+    """
+    start = time.perf_counter()
+    stats = {'read': 0, 'imported': 0, 'duplicates': 0, 'rejected': 0, 'seconds': 0.0}
+    seen = {item_key(item) for item in library}
+    rejects = open(rejects_file, 'w', encoding='utf-8') if rejects_file else None
+
+    def add_batch(batch, bad):
+        items, rejected = clean_batch([row for line, row in batch])
+        rejected = bad + [(batch[i][0], batch[i][1], reason) for i, reason in rejected]
+        new_items = []
+        for item in items:
+            key = item_key(item)
+            if key in seen:
+                stats['duplicates'] += 1
+            else:
+                seen.add(key)
+                new_items.append(item)
+        library.add_many(new_items)
+        stats['imported'] += len(new_items)
+        stats['rejected'] += len(rejected)
+        if rejects:
+            for line, row, reason in rejected:
+                rejects.write(json.dumps({'line': line, 'reason': reason, 'row': row}) + "\n")
+
+    try:
+        batch = []
+        bad = []
+        for line, row, problem in read_records(filename):
+            stats['read'] += 1
+            if row is None:
+                bad.append((line, None, problem))
+            else:
+                batch.append((line, row))
+            if len(batch) + len(bad) >= batch_size:
+                add_batch(batch, bad)
+                batch = []
+                bad = []
+        add_batch(batch, bad)
+    finally:
+        if rejects:
+            rejects.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+def export_file(library, filename):
+    """Write every item in library to a CSV or JSONL file, returns how many"""
+    count = 0
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        if file_format(filename) == 'csv':
+            writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction='ignore', restval='')
+            writer.writeheader()
+            for item in library:
+                writer.writerow(item.to_row())
+                count += 1
+        else:
+            for item in library:
+                file.write(json.dumps(item.to_row()) + "\n")
+                count += 1
+    return count
@@ -0,0 +1,185 @@
+#DU P1 Larose PERSONAL LIBRARY / library_item.py
+# One library item, with a fixed type for every field
+
+import sys
+
+# Fields of an item, in CSV column order
+FIELDS = ('id', 'title', 'creator', 'year', 'genre', 'format', 'rating', 'notes')
+
+# Stored instead of a blank year or rating, so they are always numbers
+# (and sort before every real year and rating)
+NO_YEAR = 0
+NO_RATING = 0.0
+
+# Lowest and highest rating allowed
+MIN_RATING = 1
+MAX_RATING = 5
+
+def text(value):
+    """Value as stripped text ('' for None)"""
+    return '' if value is None else str(value).strip()
+
+def parse_year(value):
+    """Year as an int (NO_YEAR if blank), or None if it isn't a whole number"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    value = text(value)
+    if not value:
+        return NO_YEAR
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+def parse_rating(value):
+    """Rating as a float (NO_RATING if blank), or None if it isn't a number
+    from MIN_RATING to MAX_RATING"""
+    value = text(value)
+    if not value:
+        return NO_RATING
+    try:
+        rating = float(value)
+    except ValueError:
+        return None
+    if rating == NO_RATING:
+        return NO_RATING
+    if not MIN_RATING <= rating <= MAX_RATING:
+        return None
+    return rating
+
+def year_text(year):
+    return '' if year == NO_YEAR else str(year)
+
+def rating_text(rating):
+    """'4' or '4.5' ('' for no rating)"""
+    if rating == NO_RATING:
+        return ''
+    return str(int(rating)) if rating.is_integer() else str(rating)
+
+class Item:
+    """One library item
+
+    Uses __slots__ instead of a dict per item, which is a lot smaller, and
+    every field always has the same type: id and year are ints, rating is
+    a float, and the rest are strings (genre and format are interned, since
+    the same few values repeat across the whole library).
+
+    Still works like the dicts it replaced: item['title'], item.get(...),
+    item.update({...}) and dict(item) all work.
+
+    A year or rating that can't be read (like "c. 1850") counts as
+    NO_YEAR/NO_RATING, but its text is kept in unparsed and written back
+    out by to_row, so saving never loses it.
+    """
+
+    __slots__ = FIELDS + ('unparsed',)
+
+    def __init__(self):
+        # 0 until the item is added to a library
+        self.id = 0
+        self.title = ''
+        self.creator = ''
+        self.year = NO_YEAR
+        self.genre = ''
+        self.format = ''
+        self.rating = NO_RATING
+        self.notes = ''
+        # {field: text} for a year or rating that couldn't be read
+        self.unparsed = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Make an item from a CSV row, journal entry or any other mapping"""
+        item = cls()
+        item.update(row)
+        return item
+
+    def update(self, changes):
+        """Set fields from a mapping, converting each one to its type
+
+        A year or rating that can't be read is stored as NO_YEAR/NO_RATING
+        (with its text kept in unparsed). Keys that aren't fields are ignored.
+        """
+        for field, value in changes.items():
+            if field == 'id':
+                try:
+                    self.id = int(value or 0)
+                except ValueError:
+                    self.id = 0
+            elif field == 'year':
+                year = parse_year(value)
+                self.year = NO_YEAR if year is None else year
+                self.set_unparsed(field, value if year is None else None)
+            elif field == 'rating':
+                rating = parse_rating(value)
+                self.rating = NO_RATING if rating is None else rating
+                self.set_unparsed(field, value if rating is None else None)
+            elif field in ('genre', 'format'):
+                setattr(self, field, sys.intern(text(value)))
+            elif field in FIELDS:
+                setattr(self, field, '' if value is None else str(value))
+
+    def set_unparsed(self, field, value):
+        """Keep (or with None, forget) the text of a field that couldn't be read"""
+        if value is not None:
+            if self.unparsed is None:
+                self.unparsed = {}
+            self.unparsed[field] = text(value)
+        elif self.unparsed is not None:
+            self.unparsed.pop(field, None)
+            if not self.unparsed:
+                self.unparsed = None
+
+    def __getitem__(self, field):
+        if field not in FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in FIELDS:
+            raise KeyError(field)
+        self.update({field: value})
+
+    def __contains__(self, field):
+        return field in FIELDS
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in FIELDS else default
+
+    def keys(self):
+        return FIELDS
+
+    def __repr__(self):
+        return f"Item({self.to_row()!r})"
+
+    def display(self, field):
+        """A field as text to show ('' for no year or rating)"""
+        if self.unparsed is not None and field in self.unparsed:
+            return self.unparsed[field]
+        if field == 'year':
+            return year_text(self.year)
+        if field == 'rating':
+            return rating_text(self.rating)
+        return str(self[field])
+
+    def to_row(self):
+        """The item as a dict for the CSV file, JSON or SQLite
+
+        Blank year and rating are '' like in the CSV, and rating is text.
+        A year or rating that couldn't be read is written as it was.
+        """
+        row = {
+            'id': self.id,
+            'title': self.title,
+            'creator': self.creator,
+            'year': '' if self.year == NO_YEAR else self.year,
+            'genre': self.genre,
+            'format': self.format,
+            'rating': rating_text(self.rating),
+            'notes': self.notes,
+        }
+        if self.unparsed is not None:
+            row.update(self.unparsed)
+        return row
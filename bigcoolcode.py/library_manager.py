@@ -1,20 +1,333 @@
 #DU P1 Larose UPDATED PERSONAL LIBRARY / library_manager.py
 
+import argparse
 import csv
+import json
 import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, so sessions there don't lock the library
+    # and only one should use it at a time
+    fcntl = None
+
+import library_io
+from library_item import FIELDS, NO_YEAR, Item, parse_rating, parse_year
+from library_sqlite import SqliteLibrary
+from text_search import TextIndex
 
 # File to save the library
 FILE_NAME = "my_library.csv"
 
-# List to store all items (each item is a dictionary)
-my_library = []
+# Every change is added to the journal right away, and the CSV is only
+# rewritten (compacted) on save, on exit, or in the background once the
+# journal gets long. Loading replays the journal on top of the CSV.
+JOURNAL_FILE = FILE_NAME + ".journal"
+# A compaction in progress moves the journal here until the new CSV is written
+OLD_JOURNAL_FILE = JOURNAL_FILE + ".old"
+
+# Several sessions can share the library: each one takes this lock before
+# changing the library or its files, and first merges in what the others
+# added to the journal (see merge_changes)
+LOCK_FILE = FILE_NAME + ".lock"
+
+# Force journal entries onto the disk after this many changes
+JOURNAL_SYNC_EVERY = 20
+
+# Compact in the background once the journal has this many changes
+COMPACT_AFTER = 1000
+
+# SQLite database to use instead of the CSV (None keeps the CSV).
+# Set by running with --sqlite, which uses DEFAULT_DB_FILE if no name is given.
+DB_FILE = None
+DEFAULT_DB_FILE = "my_library.db"
+
+# How many items the quick and detailed views show at a time
+VIEW_PAGE_SIZE = 20
+
+# Most results a search shows
+SEARCH_LIMIT = 20
+
+# How many changes can be undone
+UNDO_LIMIT = 500
+
+# Fields we keep a lookup index for
+INDEXED_FIELDS = ['title', 'creator', 'genre', 'year']
+
+# Fields the library can be listed in order of
+SORTED_FIELDS = ['title', 'year', 'rating']
+
+class Library:
+    """All library items, each with an id that never changes
+
+    Items are kept in a dict by id, so finding or deleting one item is O(1),
+    and each field in INDEXED_FIELDS has an index of value -> item ids.
+    text_index has every word of every item for ranked_search.
+    
+    For each field in SORTED_FIELDS there is also a list of (value, id)
+    kept in order with bisect, so sorted views and year/rating ranges
+    never have to sort the library.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self.sorted = {field: [] for field in SORTED_FIELDS}
+        # True while add_many is adding, see there
+        self.bulk = False
+        self.text_index = TextIndex()
+        self.next_id = 1
+        
+        # Called as listener(op, item_id, data) after every add/update/delete
+        self.listener = None
+        
+        # Items added or changed, and items deleted, since the last save
+        self.dirty_ids = set()
+        self.deleted_ids = set()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def page(self, cursor, limit):
+        """Up to limit items after cursor (None for the first page)
+
+        Returns (items, next cursor), with None as the next cursor on the
+        last page, the same as SqliteLibrary.page.
+        """
+        start = cursor or 0
+        items = list(islice(self.items.values(), start, start + limit))
+        if start + limit < len(self.items):
+            return items, start + limit
+        return items, None
+
+    @staticmethod
+    def index_key(value):
+        """Values are matched without caring about case or extra spaces"""
+        return str(value).strip().lower()
+
+    @staticmethod
+    def sort_key(item, field):
+        """What items are put in order by (titles ignore case)"""
+        return item.title.lower() if field == 'title' else item[field]
+
+    def add_to_indexes(self, item):
+        for field in INDEXED_FIELDS:
+            key = self.index_key(item.display(field))
+            self.indexes[field].setdefault(key, set()).add(item.id)
+        for field in SORTED_FIELDS:
+            if self.bulk:
+                self.sorted[field].append((self.sort_key(item, field), item.id))
+            else:
+                insort(self.sorted[field], (self.sort_key(item, field), item.id))
+
+    def remove_from_indexes(self, item):
+        for field in INDEXED_FIELDS:
+            key = self.index_key(item.display(field))
+            ids = self.indexes[field].get(key)
+            if ids:
+                ids.discard(item.id)
+                if not ids:
+                    del self.indexes[field][key]
+        for field in SORTED_FIELDS:
+            keys = self.sorted[field]
+            del keys[bisect_left(keys, (self.sort_key(item, field), item.id))]
+
+    def add(self, item, item_id=None):
+        """Add an item (an Item or a dict) and return its id
+
+        A new id is picked if none is given.
+        """
+        if not isinstance(item, Item):
+            item = Item.from_row(item)
+        if item_id is None or item_id in self.items:
+            item_id = self.next_id
+        self.next_id = max(self.next_id, item_id + 1)
+        item.id = item_id
+        self.items[item_id] = item
+        self.add_to_indexes(item)
+        self.text_index.add(item_id, item, keep_sorted=not self.bulk)
+        self.dirty_ids.add(item_id)
+        if self.listener:
+            self.listener('add', item_id, item)
+        return item_id
+
+    def add_many(self, items):
+        """Add many items (keeping their ids if they have one), returns
+        their ids (same as SqliteLibrary.add_many)
+
+        Inserting into the sorted lists one at a time gets slow with a lot
+        of items, so they are added to the end and sorted once afterwards.
+        """
+        ids = []
+        self.bulk = True
+        try:
+            for item in items:
+                if not isinstance(item, Item):
+                    item = Item.from_row(item)
+                ids.append(self.add(item, item.id or None))
+        finally:
+            self.bulk = False
+            for keys in self.sorted.values():
+                keys.sort()
+            self.text_index.sort_vocabulary()
+        return ids
+
+    def get(self, item_id):
+        """Get an item by id (None if there isn't one)"""
+        return self.items.get(item_id)
+
+    def update(self, item_id, changes):
+        """Change some fields of an item and keep the indexes up to date"""
+        item = self.items[item_id]
+        self.remove_from_indexes(item)
+        self.text_index.remove(item_id, item)
+        item.update(changes)
+        item.id = item_id
+        self.add_to_indexes(item)
+        self.text_index.add(item_id, item)
+        self.dirty_ids.add(item_id)
+        if self.listener:
+            self.listener('update', item_id, changes)
+
+    def delete(self, item_id):
+        """Remove an item by id and return it"""
+        item = self.items.pop(item_id)
+        self.remove_from_indexes(item)
+        self.text_index.remove(item_id, item)
+        self.dirty_ids.discard(item_id)
+        self.deleted_ids.add(item_id)
+        if self.listener:
+            self.listener('delete', item_id, None)
+        return item
+
+    def has_changes(self):
+        """True if anything was added, changed or deleted since the last save"""
+        return bool(self.dirty_ids or self.deleted_ids)
+
+    def take_changes(self):
+        """Return (changed ids, deleted ids) and start tracking from scratch"""
+        changes = (self.dirty_ids, self.deleted_ids)
+        self.dirty_ids = set()
+        self.deleted_ids = set()
+        return changes
 
-# Track if we have unsaved changes
-changes_made = False
+    def restore_changes(self, changes):
+        """Put back changes from take_changes (when a save failed)"""
+        dirty_ids, deleted_ids = changes
+        self.dirty_ids |= {item_id for item_id in dirty_ids if item_id in self.items}
+        self.deleted_ids |= {item_id for item_id in deleted_ids if item_id not in self.items}
+
+    def find(self, field, value):
+        """Items whose field exactly matches value (ignoring case)"""
+        ids = self.indexes[field].get(self.index_key(value), ())
+        return [self.items[item_id] for item_id in sorted(ids)]
+
+    def search(self, text):
+        """Items with text anywhere in their title, creator, genre or year
+
+        Only the distinct values in the indexes are checked, not every item.
+        """
+        text = self.index_key(text)
+        found = set()
+        for field in INDEXED_FIELDS:
+            for key, ids in self.indexes[field].items():
+                if text in key:
+                    found.update(ids)
+        return [self.items[item_id] for item_id in sorted(found)]
+
+    def key_range(self, field, low=None, high=None):
+        """(start, stop) of the keys from low to high in sorted[field]"""
+        keys = self.sorted[field]
+        start = 0 if low is None else bisect_left(keys, (low,))
+        stop = len(keys) if high is None else bisect_right(keys, (high, float('inf')))
+        return start, max(start, stop)
+
+    def sorted_items(self, field, reverse=False, years=None, min_rating=None):
+        """Items in order of field, optionally only ones with a year from
+        years = (first, last) (either can be None) and rated min_rating or more
+
+        If the order is by a field that is being filtered, this just walks
+        that part of the sorted list. Otherwise only the items that match
+        the narrowest filter are sorted, never the whole library.
+        """
+        ranges = {}
+        if years is not None:
+            first, last = years
+            # Items without a year never match a year filter
+            ranges['year'] = (NO_YEAR + 1 if first is None else first, last)
+        if min_rating is not None:
+            ranges['rating'] = (min_rating, None)
+        spans = {name: self.key_range(name, *bounds) for name, bounds in ranges.items()}
+        
+        def matches(item):
+            for name, (low, high) in ranges.items():
+                value = item[name]
+                if value < low or (high is not None and value > high):
+                    return False
+            return True
+        
+        if field in spans or not spans:
+            keys = self.sorted[field]
+            start, stop = spans.get(field, (0, len(keys)))
+            positions = range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+            return (item for item in (self.items[keys[i][1]] for i in positions) if matches(item))
+        
+        narrowest = min(spans, key=lambda name: spans[name][1] - spans[name][0])
+        start, stop = spans[narrowest]
+        found = [self.items[item_id] for key, item_id in self.sorted[narrowest][start:stop]]
+        found = [item for item in found if matches(item)]
+        found.sort(key=lambda item: (self.sort_key(item, field), item.id), reverse=reverse)
+        return iter(found)
+
+    def ranked_search(self, text, limit=SEARCH_LIMIT):
+        """The best limit items with every word of text in any field
+
+        Words also match longer words they start, and the results are
+        ranked with BM25, so items where the words are rarer, repeated or
+        in the title come first.
+        """
+        return [self.items[item_id] for score, item_id in self.text_index.search(text, limit)]
+
+# All items in the library
+my_library = Library()
+
+# Open journal file, how many entries haven't been synced to disk yet, and
+# whether there are changes that never went into it (see import_items)
+journal = {'file': None, 'unsynced': 0, 'entries': 0, 'unlogged': False}
+
+# The lock on LOCK_FILE. flock doesn't keep our own threads apart, so there
+# is a thread lock too (a background compaction holds both until it's done).
+lock = {'file': None, 'thread': threading.Lock()}
+
+# What this session has seen of the files other sessions write: the
+# journal it reads their changes from (the file position is how far it
+# has got) and that journal's generation (each save starts the next one),
+# and the CSV's (mtime, size) when it was last loaded or saved
+shared = {'reader': None, 'generation': 0, 'csv': None}
+
+# Background compaction: the thread, the changes it is saving, and any error
+compaction = {'thread': None, 'changes': None, 'error': None}
+
+# Changes that can be undone and redone. Each entry is (op, item id, data)
+# with only what is needed to reverse that one change: nothing for an add,
+# the old values of the changed fields for an update, and the removed item
+# for a delete. So the history grows with the edits, not with the library.
+history = {'undo': deque(maxlen=UNDO_LIMIT), 'redo': []}
 
 def main():
     """Main program function"""
-    global my_library, changes_made
+    global my_library
     
     print("=" * 40)
     print("     MY PERSONAL LIBRARY")
@@ -28,30 +341,51 @@ def main():
         print("\n--- MAIN MENU ---")
         print("1. Quick view (Title + Creator)")
         print("2. Detailed view (All info)")
-        print("3. Add an item")
-        print("4. Update an item")
-        print("5. Delete an item")
-        print("6. Save to file")
-        print("7. Reload from file")
-        print("8. Exit")
+        print("3. Sorted / filtered view (by title, year or rating)")
+        print("4. Add an item")
+        print("5. Update an item")
+        print("6. Delete an item")
+        print("7. Undo last change")
+        print("8. Redo")
+        print("9. Save to file")
+        print("10. Reload from file")
+        print("11. Search items")
+        print("12. Import items from a file")
+        print("13. Export items to a file")
+        print("14. Exit")
         
-        choice = get_choice(1, 8)
+        choice = get_choice(1, 14)
+        
+        # Other sessions may have changed the library while we waited
+        check_for_changes()
         
         if choice == 1:
             show_simple()
         elif choice == 2:
             show_detailed()
         elif choice == 3:
-            add_item()
+            show_sorted()
         elif choice == 4:
-            update_item()
+            add_item()
         elif choice == 5:
-            delete_item()
+            update_item()
         elif choice == 6:
-            save_library()
+            delete_item()
         elif choice == 7:
-            reload_library()
+            undo()
         elif choice == 8:
+            redo()
+        elif choice == 9:
+            save_library()
+        elif choice == 10:
+            reload_library()
+        elif choice == 11:
+            search_items()
+        elif choice == 12:
+            import_items()
+        elif choice == 13:
+            export_items()
+        elif choice == 14:
             exit_program()
             break
 
@@ -68,60 +402,555 @@ def get_choice(min_num, max_num):
             print("That's not a number. Try again.")
 
 def load_library():
-    """Load library from CSV file"""
+    """Load library from the CSV file and replay the journal on top of it"""
+    wait_for_compaction()
+    close_journal()
+    
+    # The history refers to items in the library we are replacing
+    history['undo'].clear()
+    history['redo'].clear()
+    
+    if DB_FILE:
+        open_database()
+        return
+    
+    # No other session can save or compact while we read
+    acquire_lock()
+    try:
+        read_library()
+    finally:
+        release_lock()
+    
+    # From now on every change goes into the journal
+    my_library.listener = log_change
+
+def read_library():
+    """Read the CSV and journals into a new my_library (with the lock held)"""
     global my_library
     
     try:
+        my_library = Library()
+        
         # Check if file exists
         if not os.path.exists(FILE_NAME):
             print(f"No file found. Starting with empty library.")
-            my_library = []
-            return
-        
-        my_library = []
-        with open(FILE_NAME, 'r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Try to convert year to number
-                try:
-                    row['year'] = int(row['year'])
-                except:
-                    pass  # Keep as string if can't convert
-                my_library.append(row)
+        else:
+            with open(FILE_NAME, 'r', newline='') as file:
+                reader = csv.DictReader(file)
+                has_ids = 'id' in (reader.fieldnames or [])
+                # Older files don't have an id column, so those items get new ids
+                my_library.add_many(Item.from_row(row) for row in reader)
+            
+            print(f"Loaded {len(my_library)} items from {FILE_NAME}")
+            
+            # Items match the file now (unless the file is missing its
+            # id column, then the next save adds it)
+            if has_ids:
+                my_library.take_changes()
+        shared['csv'] = csv_signature()
         
-        print(f"Loaded {len(my_library)} items from {FILE_NAME}")
+        # Changes that haven't been compacted into the CSV yet. The journal
+        # is read through the file we then keep following for changes
+        # other sessions make.
+        replayed = replay_journal(OLD_JOURNAL_FILE)
+        shared['generation'] = 0
+        follow_journal()
+        replayed += read_journal()[0]
+        journal['entries'] = replayed
+        if replayed:
+            print(f"Replayed {replayed} unsaved changes from the journal")
         
     except Exception as e:
         print(f"Error loading file: {e}")
-        my_library = []
+        my_library = Library()
 
-def save_library():
-    """Save library to CSV file"""
-    global changes_made
+def open_database():
+    """Use the SQLite database in DB_FILE (filled from the CSV the first time)"""
+    global my_library
+    
+    if isinstance(my_library, SqliteLibrary):
+        my_library.close()
+    
+    try:
+        my_library = SqliteLibrary(DB_FILE)
+    except Exception as e:
+        print(f"Error opening database: {e}")
+        raise SystemExit(1)
+    
+    # SQLite keeps its own journal, so changes don't go into ours
+    my_library.listener = None
+    
+    if not my_library and os.path.exists(FILE_NAME):
+        try:
+            import_csv()
+        except Exception as e:
+            print(f"Error importing {FILE_NAME}: {e}")
+    
+    print(f"Using {DB_FILE} ({len(my_library)} items)")
+
+def import_csv():
+    """Copy the CSV file (and its journal) into an empty database"""
+    with open(FILE_NAME, 'r', newline='') as file:
+        rows = []
+        for row in csv.DictReader(file):
+            rows.append(Item.from_row(row))
+            
+            # One transaction per batch, so the whole CSV is never in memory
+            if len(rows) >= 1000:
+                my_library.add_many(rows)
+                rows = []
+        my_library.add_many(rows)
+    
+    replayed = replay_journal(OLD_JOURNAL_FILE) + replay_journal(JOURNAL_FILE)
+    print(f"Imported {FILE_NAME} into {DB_FILE} ({replayed} journal changes)")
+
+def replay_journal(filename):
+    """Apply the changes in a journal file to my_library, returns how many"""
+    if not os.path.exists(filename):
+        return 0
+    
+    count = 0
+    with open(filename, 'r') as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash can leave half a line at the end, skip it
+                continue
+            if apply_entry(entry):
+                count += 1
+    return count
+
+def apply_entry(entry):
+    """Apply one journal entry to my_library (False if it isn't a change,
+    like the 'start' entry at the top of each journal)"""
+    op = entry.get('op')
+    item_id = entry.get('id')
+    if op == 'add':
+        item = dict(entry['item'])
+        if my_library.get(item_id) is not None:
+            my_library.update(item_id, item)
+        else:
+            my_library.add(item, item_id)
+    elif op == 'update':
+        if my_library.get(item_id) is not None:
+            my_library.update(item_id, entry['changes'])
+    elif op == 'delete':
+        if my_library.get(item_id) is not None:
+            my_library.delete(item_id)
+    else:
+        return False
+    return True
+
+def log_change(op, item_id, data):
+    """Append one change to the journal (my_library calls this on every change)"""
+    entry = {'op': op, 'id': item_id}
+    if op == 'add':
+        entry['item'] = data.to_row()
+    elif op == 'update':
+        entry['changes'] = data
+    write_entry(entry)
+    journal['entries'] += 1
+
+def write_entry(entry):
+    """Add an entry to the end of the journal (with the lock held)"""
+    if journal['file'] is None:
+        journal['file'] = open(JOURNAL_FILE, 'a')
+    journal['file'].write(json.dumps(entry) + "\n")
+    # Flushed straight away so other sessions see it, but fsync is slow,
+    # so that's only done every JOURNAL_SYNC_EVERY changes
+    journal['file'].flush()
+    journal['unsynced'] += 1
+    if journal['unsynced'] >= JOURNAL_SYNC_EVERY:
+        sync_journal()
+    
+    # We already have this change, so don't read it back as someone else's
+    if shared['reader'] is not None:
+        shared['reader'].seek(0, os.SEEK_END)
+
+def acquire_lock(wait=True):
+    """Take the library lock
+
+    With wait=False this gives up straight away and returns False if another
+    session (or our own background compaction) has it.
+    """
+    if not lock['thread'].acquire(blocking=wait):
+        return False
+    if fcntl is None:
+        return True
+    try:
+        if lock['file'] is None:
+            lock['file'] = open(LOCK_FILE, 'a')
+        fcntl.flock(lock['file'], fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock['thread'].release()
+        return False
+    except BaseException:
+        lock['thread'].release()
+        raise
+    return True
+
+def release_lock():
+    if fcntl is not None and lock['file'] is not None:
+        fcntl.flock(lock['file'], fcntl.LOCK_UN)
+    lock['thread'].release()
+
+@contextmanager
+def library_lock():
+    """Hold the lock while changing the library, with every other session's
+    changes merged in first (so ours go on top of theirs, and new ids
+    can't clash with theirs)"""
+    if DB_FILE:
+        # SQLite does its own locking
+        yield
+        return
     
+    acquire_lock()
+    try:
+        merge_changes()
+        yield
+    finally:
+        release_lock()
+    
+    # Compaction takes the lock itself, so it has to wait until here
+    if journal['entries'] >= COMPACT_AFTER:
+        start_compaction()
+
+def csv_signature():
+    """(mtime, size) of the CSV file, None if there isn't one"""
+    try:
+        info = os.stat(FILE_NAME)
+    except FileNotFoundError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+def follow_journal():
+    """Start reading JOURNAL_FILE from the beginning (making an empty one if
+    there isn't one yet, so there is always a file to follow)"""
+    if shared['reader'] is not None:
+        shared['reader'].close()
+    open(JOURNAL_FILE, 'ab').close()
+    shared['reader'] = open(JOURNAL_FILE, 'rb')
+
+def journal_moved():
+    """True if the journal we follow isn't JOURNAL_FILE any more (a save or
+    compaction moved it aside)"""
+    try:
+        current = os.stat(JOURNAL_FILE)
+    except FileNotFoundError:
+        return True
+    following = os.fstat(shared['reader'].fileno())
+    return (current.st_ino, current.st_dev) != (following.st_ino, following.st_dev)
+
+def read_journal():
+    """Apply the entries added to the journal we follow since we last read it
+
+    Returns (how many changes, whether an entry said to reload the CSV).
+    """
+    reader = shared['reader']
+    count = 0
+    reload = False
+    while True:
+        line = reader.readline()
+        if not line.endswith(b"\n"):
+            # The end, or a line another session is still writing: read it
+            # next time instead
+            reader.seek(-len(line), os.SEEK_CUR)
+            break
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        op = entry.get('op')
+        if op == 'start':
+            shared['generation'] = entry['generation']
+        elif op == 'reload':
+            reload = True
+        elif apply_entry(entry):
+            count += 1
+    return count, reload
+
+def merge_changes():
+    """Bring in the changes other sessions made since we last looked, returns
+    how many (must be called with the lock held)
+
+    Each session appends its changes to the shared journal, so we only
+    need to read the new end of it. When another session saves, the
+    journal we were reading is moved aside and a new one started, but our
+    open file still has the rest of the old one, so we finish that and
+    carry on with the new one. Only a CSV changed some other way, a
+    'reload' entry from an import (see import_items), or more than one
+    save since we last looked (so we missed a whole journal) means reading
+    the whole library again.
+    """
+    if DB_FILE or shared['reader'] is None:
+        return 0
+    
+    listener = my_library.listener
+    my_library.listener = None
+    try:
+        merged, reload = read_journal()
+        if journal_moved():
+            # Our journal file is the old one too
+            close_journal()
+            expected = shared['generation'] + 1
+            if csv_signature() != shared['csv']:
+                # The other session saved everything we've just read, and
+                # all of ours is in there as well (unless we have some
+                # that never went into the journal)
+                if not journal['unlogged']:
+                    my_library.take_changes()
+                shared['csv'] = csv_signature()
+            follow_journal()
+            more, more_reload = read_journal()
+            merged += more
+            reload = reload or more_reload or shared['generation'] != expected
+        elif csv_signature() != shared['csv']:
+            reload = True
+    finally:
+        my_library.listener = listener
+    
+    if reload:
+        close_journal()
+        history['undo'].clear()
+        history['redo'].clear()
+        print("\nThe library file was changed outside this session, loading it again...")
+        read_library()
+        my_library.listener = listener
+        return 0
+    
+    journal['entries'] += merged
+    return merged
+
+def check_for_changes():
+    """Merge in other sessions' changes if the journal or CSV has changed
+
+    Called after each menu choice, and only looks at the files' sizes and
+    mtimes unless something did change.
+    """
+    if DB_FILE or shared['reader'] is None:
+        return
+    try:
+        size = os.path.getsize(JOURNAL_FILE)
+    except FileNotFoundError:
+        size = None
+    if (not journal_moved() and size == shared['reader'].tell()
+            and csv_signature() == shared['csv']):
+        return
+    
+    # If someone is busy writing, look again next time
+    if not acquire_lock(wait=False):
+        return
+    try:
+        merged = merge_changes()
+    finally:
+        release_lock()
+    if merged:
+        print(f"\n({merged} change(s) from another session merged in)")
+
+def sync_journal():
+    """Make sure every journal entry so far is really on the disk"""
+    if journal['file'] is not None and journal['unsynced']:
+        journal['file'].flush()
+        os.fsync(journal['file'].fileno())
+        journal['unsynced'] = 0
+
+def close_journal():
+    """Sync and close the journal file"""
+    sync_journal()
+    if journal['file'] is not None:
+        journal['file'].close()
+        journal['file'] = None
+
+def rotate_journal():
+    """Move the journal aside so a compaction can start a fresh one"""
+    close_journal()
+    if os.path.exists(JOURNAL_FILE):
+        if os.path.exists(OLD_JOURNAL_FILE):
+            # An earlier compaction didn't finish, so keep both sets of changes
+            with open(JOURNAL_FILE, 'r') as new_file, open(OLD_JOURNAL_FILE, 'a') as old_file:
+                old_file.write(new_file.read())
+                old_file.flush()
+                os.fsync(old_file.fileno())
+            os.remove(JOURNAL_FILE)
+        else:
+            os.replace(JOURNAL_FILE, OLD_JOURNAL_FILE)
+    
+    # Other sessions check the generation to know they haven't missed one
+    follow_journal()
+    shared['generation'] += 1
+    write_entry({'op': 'start', 'generation': shared['generation']})
+
+def sync_folder(folder):
+    """fsync a folder so a rename inside it survives a crash (not on Windows)"""
+    if os.name == 'nt':
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_csv(rows):
+    """Safely replace the CSV file with rows
+
+    Everything is written to a temp file in the same folder first, and only
+    then renamed over the CSV, so a crash at any point leaves either the
+    old file or the new one, never half of one.
+    """
+    folder = os.path.dirname(os.path.abspath(FILE_NAME))
+    fd, temp_name = tempfile.mkstemp(prefix=os.path.basename(FILE_NAME) + '.', suffix='.tmp', dir=folder)
     try:
-        with open(FILE_NAME, 'w', newline='') as file:
+        with os.fdopen(fd, 'w', newline='') as file:
             # Make sure we have all possible fields
-            fieldnames = ['title', 'creator', 'year', 'genre', 'format', 'rating', 'notes']
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction='ignore', restval='')
             
             # Write header
             writer.writeheader()
             
             # Write all items
-            for item in my_library:
-                # Make sure all fields exist
-                row = {}
-                for field in fieldnames:
-                    row[field] = item.get(field, '')
-                writer.writerow(row)
+            writer.writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
         
-        changes_made = False
-        print(f"Saved {len(my_library)} items to {FILE_NAME}")
+        # mkstemp makes the file owner-only, so keep the old file's permissions,
+        # or give a brand new CSV the ones open() would have
+        try:
+            mode = os.stat(FILE_NAME).st_mode
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, FILE_NAME)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+    shared['csv'] = csv_signature()
+    sync_folder(folder)
+    
+    # The changes in the old journal are in the CSV now
+    if os.path.exists(OLD_JOURNAL_FILE):
+        os.remove(OLD_JOURNAL_FILE)
+
+def run_compaction(rows):
+    """Background thread: write the CSV, remember any error, and let go of
+    the lock start_compaction took"""
+    try:
+        write_csv(rows)
+    except Exception as e:
+        compaction['error'] = e
+    finally:
+        release_lock()
+
+def start_compaction():
+    """Rewrite the CSV from a copy of the library in a background thread
+
+    The thread keeps the lock until the CSV is written, so changes (ours
+    and other sessions') wait for it, but viewing and searching don't.
+    """
+    if compaction['thread'] is not None and compaction['thread'].is_alive():
+        return
+    
+    # Someone else is busy, try again after a later change
+    if not acquire_lock(wait=False):
+        return
+    try:
+        merge_changes()
+        rotate_journal()
+        journal['entries'] = 0
+        compaction['changes'] = my_library.take_changes()
+        compaction['error'] = None
         
+        # Copy the items now so later edits can't change them while writing
+        rows = [item.to_row() for item in my_library]
+        compaction['thread'] = threading.Thread(target=run_compaction, args=(rows,), daemon=True)
+        compaction['thread'].start()
+    except BaseException:
+        release_lock()
+        raise
+
+def wait_for_compaction():
+    """Wait for a background compaction to finish"""
+    if compaction['thread'] is None:
+        return
+    compaction['thread'].join()
+    compaction['thread'] = None
+    
+    if compaction['error'] is not None:
+        # The old journal is still there, so nothing is lost, but the
+        # changes still need saving
+        print(f"Background save failed: {compaction['error']}")
+        my_library.restore_changes(compaction['changes'])
+    compaction['changes'] = None
+    compaction['error'] = None
+
+def save_library():
+    """Save the whole library to the CSV file (and empty the journal)"""
+    if DB_FILE:
+        print(f"Every change is already saved in {DB_FILE}.")
+        return
+    
+    try:
+        wait_for_compaction()
+        with library_lock():
+            write_library()
     except Exception as e:
         print(f"Error saving: {e}")
 
+def write_library():
+    """Save the library to the CSV file (with the lock held)"""
+    if not my_library.has_changes() and os.path.exists(FILE_NAME):
+        print("No changes to save.")
+        return
+    
+    rotate_journal()
+    changed, deleted = my_library.take_changes()
+    try:
+        write_csv(item.to_row() for item in my_library)
+    except Exception:
+        my_library.restore_changes((changed, deleted))
+        raise
+    journal['entries'] = 0
+    
+    if journal['unlogged']:
+        # Other sessions can't know about these from the journal
+        write_entry({'op': 'reload'})
+        journal['unlogged'] = False
+    print(f"Saved {len(my_library)} items to {FILE_NAME} ({len(changed)} changed, {len(deleted)} deleted)")
+
+def library_pages():
+    """Yield the library a page of VIEW_PAGE_SIZE items at a time"""
+    cursor = None
+    while True:
+        items, cursor = my_library.page(cursor, VIEW_PAGE_SIZE)
+        yield items
+        if cursor is None:
+            return
+
+def show_pages(show_item, pages=None):
+    """Show pages of items (the whole library if pages is None) one at a
+    time, returns how many items were shown
+
+    Only one page is read at a time, so this works the same however big
+    the library is.
+    """
+    if pages is None:
+        pages = library_pages()
+    shown = 0
+    page = next(pages, None)
+    while page:
+        for item in page:
+            show_item(item)
+        shown += len(page)
+        page = next(pages, None)
+        if not page:
+            break
+        if input("\nPress Enter for more ('q' to stop): ").strip().lower() == 'q':
+            break
+    return shown
+
 def show_simple():
     """Show just title and creator"""
     if not my_library:
@@ -132,10 +961,12 @@ def show_simple():
     print("QUICK VIEW")
     print("-" * 50)
     
-    for i, item in enumerate(my_library, 1):
-        title = item.get('title', 'No title')
-        creator = item.get('creator', 'No creator')
-        print(f"{i}. {title} - {creator}")
+    show_pages(show_simple_item)
+
+def show_simple_item(item):
+    title = item.get('title', 'No title')
+    creator = item.get('creator', 'No creator')
+    print(f"#{item.id}. {title} - {creator}")
 
 def show_detailed():
     """Show all information"""
@@ -147,25 +978,81 @@ def show_detailed():
     print("DETAILED VIEW")
     print("-" * 60)
     
-    for i, item in enumerate(my_library, 1):
-        print(f"\n--- Item #{i} ---")
-        print(f"Title: {item.get('title', 'N/A')}")
-        print(f"Creator: {item.get('creator', 'N/A')}")
-        print(f"Year: {item.get('year', 'N/A')}")
-        print(f"Genre: {item.get('genre', 'N/A')}")
-        
-        # Optional fields
-        if item.get('format'):
-            print(f"Format: {item['format']}")
-        if item.get('rating'):
-            print(f"Rating: {item['rating']}")
-        if item.get('notes'):
-            print(f"Notes: {item['notes']}")
+    show_pages(show_detailed_item)
+
+def show_detailed_item(item):
+    print(f"\n--- Item #{item.id} ---")
+    print(f"Title: {item.title}")
+    print(f"Creator: {item.creator}")
+    print(f"Year: {item.display('year')}")
+    print(f"Genre: {item.genre}")
+    
+    # Optional fields
+    if item.format:
+        print(f"Format: {item.format}")
+    if item.display('rating'):
+        print(f"Rating: {item.display('rating')}")
+    if item.notes:
+        print(f"Notes: {item.notes}")
+
+def show_sorted():
+    """Show items in order of title, year or rating, optionally only
+    some years and ratings"""
+    if not my_library:
+        print("\nLibrary is empty!")
+        return
+    
+    print("\nSort by:")
+    print("1. Title")
+    print("2. Year")
+    print("3. Rating")
+    field = SORTED_FIELDS[get_choice(1, 3) - 1]
+    reverse = input("Reverse order (Z-A / newest / highest first)? (y/n): ").strip().lower() == 'y'
+    
+    print("(Press Enter to skip a filter)")
+    first = ask_year("Years from: ")
+    last = ask_year("Years to: ")
+    years = None if first is None and last is None else (first, last)
+    
+    min_rating = None
+    rating_input = input("Minimum rating (1-5): ").strip()
+    while rating_input and parse_rating(rating_input) is None:
+        print("Please enter a number from 1 to 5 (or press Enter to skip)")
+        rating_input = input("Minimum rating (1-5): ").strip()
+    if rating_input:
+        min_rating = parse_rating(rating_input)
+    
+    print("\n" + "-" * 60)
+    print(f"SORTED BY {field.upper()}")
+    print("-" * 60)
+    
+    items = my_library.sorted_items(field, reverse, years, min_rating)
+    pages = iter(lambda: list(islice(items, VIEW_PAGE_SIZE)), [])
+    if not show_pages(show_sorted_item, pages):
+        print("No items match.")
+
+def ask_year(prompt):
+    """Ask for a year, returns None if the user just presses Enter"""
+    while True:
+        answer = input(prompt).strip()
+        if not answer:
+            return None
+        year = parse_year(answer)
+        if year is not None:
+            return year
+        print("Please enter a number (or press Enter to skip)")
+
+def show_sorted_item(item):
+    details = []
+    if item.display('year'):
+        details.append(item.display('year'))
+    if item.display('rating'):
+        details.append(f"rated {item.display('rating')}")
+    extra = f" ({', '.join(details)})" if details else ""
+    print(f"#{item.id}. {item.title} - {item.creator}{extra}")
 
 def add_item():
     """Add a new item to library"""
-    global changes_made
-    
     print("\n--- ADD NEW ITEM ---")
     print("(Press Enter to skip optional fields)")
     
@@ -202,126 +1089,335 @@ def add_item():
     # Optional fields
     print("\nOptional fields:")
     new_item['format'] = input("Format (Book/Movie/Album): ").strip()
-    new_item['rating'] = input("Rating (1-5): ").strip()
+    rating_input = input("Rating (1-5): ").strip()
+    while parse_rating(rating_input) is None:
+        print("Please enter a number from 1 to 5 (or press Enter to skip)")
+        rating_input = input("Rating (1-5): ").strip()
+    new_item['rating'] = rating_input
     new_item['notes'] = input("Notes: ").strip()
     
     # Add to library
-    my_library.append(new_item)
-    changes_made = True
-    print("\nItem added successfully!")
+    item_id = add_with_undo(new_item)
+    print(f"\nItem added successfully! (ID #{item_id})")
 
-def update_item():
-    """Update an existing item"""
-    global changes_made
-    
+def print_matches(items):
+    """Print a short list of items with their ids"""
+    for item in items:
+        print(f"#{item.id}. {item.title} - {item.creator}")
+
+def search_items():
+    """Search every field, best matches first"""
     if not my_library:
         print("\nLibrary is empty!")
         return
     
-    show_simple()
+    text = input("\nSearch for: ").strip()
+    if not text:
+        print("Search cancelled")
+        return
     
-    try:
-        num = int(input(f"\nEnter item number to update (1-{len(my_library)}): "))
-        if num < 1 or num > len(my_library):
-            print("Invalid number!")
-            return
-        
-        item = my_library[num - 1]
-        print("\n--- UPDATE ITEM ---")
-        print("(Press Enter to keep current value)")
-        
-        # Update fields
-        new_title = input(f"Title [{item['title']}]: ").strip()
-        if new_title:
-            item['title'] = new_title
-        
-        new_creator = input(f"Creator [{item['creator']}]: ").strip()
-        if new_creator:
-            item['creator'] = new_creator
-        
-        new_year = input(f"Year [{item['year']}]: ").strip()
-        if new_year:
-            try:
-                item['year'] = int(new_year)
-            except:
-                print("Invalid year, keeping old value. (MUST BE AN INTEGER!)")
-        
-        new_genre = input(f"Genre [{item['genre']}]: ").strip()
-        if new_genre:
-            item['genre'] = new_genre
-        
-        # Optional fields
-        new_format = input(f"Format [{item.get('format', '')}]: ").strip()
-        if new_format:
-            item['format'] = new_format
+    matches = my_library.ranked_search(text, SEARCH_LIMIT)
+    if matches:
+        print(f"\nBest {len(matches)} match(es):")
+        print_matches(matches)
+        return
+    
+    # Fall back to matching text inside words ("obbi" finds "Hobbit")
+    matches = my_library.search(text)
+    if not matches:
+        print("No items found.")
+        return
+    
+    if len(matches) > SEARCH_LIMIT:
+        print(f"\nFound {len(matches)} item(s), showing the first {SEARCH_LIMIT}:")
+        matches = matches[:SEARCH_LIMIT]
+    else:
+        print(f"\nFound {len(matches)} item(s):")
+    print_matches(matches)
+
+def pick_item(action):
+    """Ask for an item id (or search for one) and return that item
+
+    Returns None if the user cancels or the id doesn't exist.
+    """
+    while True:
+        answer = input(f"\nEnter item ID to {action} ('s' to search, Enter to cancel): ").strip().lstrip('#')
         
-        new_rating = input(f"Rating [{item.get('rating', '')}]: ").strip()
-        if new_rating:
-            item['rating'] = new_rating
+        if not answer:
+            print("Cancelled")
+            return None
         
-        new_notes = input(f"Notes [{item.get('notes', '')}]: ").strip()
-        if new_notes:
-            item['notes'] = new_notes
+        if answer.lower() == 's':
+            search_items()
+            continue
         
-        changes_made = True
-        print("Item updated!")
+        try:
+            item = my_library.get(int(answer))
+        except ValueError:
+            print("Please enter a valid ID number")
+            continue
         
-    except ValueError:
-        print("Please enter a valid number")
+        if item is None:
+            print("No item with that ID!")
+            return None
+        return item
+
+def update_item():
+    """Update an existing item"""
+    if not my_library:
+        print("\nLibrary is empty!")
+        return
+    
+    item = pick_item("update")
+    if item is None:
+        return
+    
+    print("\n--- UPDATE ITEM ---")
+    print("(Press Enter to keep current value)")
+    changes = {}
+    
+    # Update fields
+    new_title = input(f"Title [{item.title}]: ").strip()
+    if new_title:
+        changes['title'] = new_title
+    
+    new_creator = input(f"Creator [{item.creator}]: ").strip()
+    if new_creator:
+        changes['creator'] = new_creator
+    
+    new_year = input(f"Year [{item.display('year')}]: ").strip()
+    if new_year:
+        try:
+            changes['year'] = int(new_year)
+        except:
+            print("Invalid year, keeping old value. (MUST BE AN INTEGER!)")
+    
+    new_genre = input(f"Genre [{item.genre}]: ").strip()
+    if new_genre:
+        changes['genre'] = new_genre
+    
+    # Optional fields
+    new_format = input(f"Format [{item.format}]: ").strip()
+    if new_format:
+        changes['format'] = new_format
+    
+    new_rating = input(f"Rating [{item.display('rating')}]: ").strip()
+    if new_rating:
+        rating = parse_rating(new_rating)
+        if rating is None:
+            print("Invalid rating, keeping old value. (MUST BE 1-5!)")
+        else:
+            changes['rating'] = rating
+    
+    new_notes = input(f"Notes [{item.notes}]: ").strip()
+    if new_notes:
+        changes['notes'] = new_notes
+    
+    if changes:
+        try:
+            update_with_undo(item.id, changes)
+        except KeyError:
+            print("Another session has deleted that item meanwhile!")
+            return
+    print("Item updated!")
 
 def delete_item():
     """Delete an item from library"""
-    global changes_made
-    
     if not my_library:
         print("\nLibrary is empty!")
         return
     
-    show_simple()
+    item = pick_item("delete")
+    if item is None:
+        return
+    
+    # Confirm deletion
+    confirm = input(f"Delete '{item.title}'? (y/n): ").lower()
     
-    try:
-        num = int(input(f"\nEnter item number to delete (1-{len(my_library)}): "))
-        if num < 1 or num > len(my_library):
-            print("Invalid number!")
+    if confirm == 'y':
+        try:
+            delete_with_undo(item.id)
+        except KeyError:
+            print("Another session has already deleted it!")
             return
+        print("Item deleted!")
+    else:
+        print("Delete cancelled")
+
+def import_items():
+    """Add every item from a CSV or JSONL file"""
+    filename = input("\nFile to import (.csv or .jsonl): ").strip()
+    if not filename:
+        print("Import cancelled")
+        return
+    if not os.path.exists(filename):
+        print("No file with that name!")
+        return
+    
+    rejects_file = filename + ".rejected.jsonl"
+    
+    # One journal entry per item would be slow for a big file, so the
+    # import is saved in one go at the end instead, without letting go of
+    # the lock until then (other sessions are told to reload after)
+    wait_for_compaction()
+    with library_lock():
+        listener = my_library.listener
+        my_library.listener = None
+        count = len(my_library)
+        try:
+            stats = library_io.import_file(my_library, filename, rejects_file)
+        except Exception as e:
+            print(f"Error importing: {e}")
+            stats = None
+        finally:
+            my_library.listener = listener
+            if len(my_library) != count and not DB_FILE:
+                journal['unlogged'] = True
         
-        # Confirm deletion
-        item = my_library[num - 1]
-        confirm = input(f"Delete '{item['title']}'? (y/n): ").lower()
+        if stats is not None:
+            rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+            print(f"Read {stats['read']} rows in {stats['seconds']:.1f}s ({rate:,.0f} rows/s)")
+            print(f"Imported {stats['imported']}, skipped {stats['duplicates']} already in the library, "
+                  f"rejected {stats['rejected']}")
+            if stats['rejected']:
+                print(f"Rejected rows and why are in {rejects_file}")
+            elif os.path.exists(rejects_file):
+                os.remove(rejects_file)
         
-        if confirm == 'y':
-            del my_library[num - 1]
-            changes_made = True
-            print("Item deleted!")
-        else:
-            print("Delete cancelled")
-            
-    except ValueError:
-        print("Please enter a valid number")
+        # Save even after an error, so the items that did get in aren't lost
+        if my_library.has_changes():
+            try:
+                write_library()
+            except Exception as e:
+                print(f"Error saving: {e}")
+
+def export_items():
+    """Write every item to a CSV or JSONL file"""
+    filename = input("\nFile to export to (.csv or .jsonl): ").strip()
+    if not filename:
+        print("Export cancelled")
+        return
+    if os.path.abspath(filename) in (os.path.abspath(FILE_NAME), os.path.abspath(DB_FILE or FILE_NAME)):
+        print("That's the library's own file, pick another name!")
+        return
+    
+    try:
+        start = time.perf_counter()
+        count = library_io.export_file(my_library, filename)
+        seconds = time.perf_counter() - start
+        print(f"Exported {count} items to {filename} in {seconds:.1f}s")
+    except Exception as e:
+        print(f"Error exporting: {e}")
+
+def remember(entry):
+    """Add a change to the undo history (a new change can't be redone over)"""
+    history['undo'].append(entry)
+    history['redo'].clear()
+
+def add_with_undo(item):
+    with library_lock():
+        item_id = my_library.add(item)
+    remember(('add', item_id, None))
+    return item_id
+
+def update_with_undo(item_id, changes):
+    """Change an item (KeyError if another session has deleted it)"""
+    with library_lock():
+        item = my_library.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        # Old values as written, so a year like "c. 1850" comes back as it was
+        row = item.to_row()
+        old = {field: row[field] for field in changes}
+        my_library.update(item_id, changes)
+    remember(('update', item_id, old))
+
+def delete_with_undo(item_id):
+    """Delete an item (KeyError if another session already has)"""
+    with library_lock():
+        item = my_library.delete(item_id)
+    remember(('delete', item_id, item))
+
+def reverse_change(entry):
+    """Undo one history entry and return the entry that redoes it
+
+    This goes through the normal add/update/delete, so the journal, the
+    indexes and the list of unsaved changes all stay right. Raises KeyError
+    if another session has deleted the item since.
+    """
+    op, item_id, data = entry
+    if op == 'add':
+        item = my_library.delete(item_id)
+        return ('delete', item_id, item), f"Removed #{item_id} '{item.title}'"
+    if op == 'delete':
+        # Ids are never reused, so the item gets its old id back
+        my_library.add(data, item_id)
+        return ('add', item_id, None), f"Put back #{item_id} '{data.title}'"
+    item = my_library.get(item_id)
+    if item is None:
+        raise KeyError(item_id)
+    row = item.to_row()
+    current = {field: row[field] for field in data}
+    my_library.update(item_id, data)
+    item = my_library.get(item_id)
+    return ('update', item_id, current), f"Changed {', '.join(data)} of #{item_id} '{item.title}'"
+
+def undo():
+    """Undo the last change"""
+    if not history['undo']:
+        print("\nNothing to undo.")
+        return
+    entry = history['undo'].pop()
+    try:
+        with library_lock():
+            redo_entry, message = reverse_change(entry)
+    except KeyError:
+        print("\nCan't undo that, another session has deleted the item since.")
+        return
+    history['redo'].append(redo_entry)
+    print(f"\nUndone: {message}")
+
+def redo():
+    """Redo the last change that was undone"""
+    if not history['redo']:
+        print("\nNothing to redo.")
+        return
+    entry = history['redo'].pop()
+    try:
+        with library_lock():
+            undo_entry, message = reverse_change(entry)
+    except KeyError:
+        print("\nCan't redo that, another session has deleted the item since.")
+        return
+    history['undo'].append(undo_entry)
+    print(f"\nRedone: {message}")
 
 def reload_library():
     """Reload library from file"""
-    global changes_made, my_library
-    
-    if changes_made:
-        confirm = input("You have unsaved changes. Reload anyway? (y/n): ").lower()
-        if confirm != 'y':
-            print("Reload cancelled")
-            return
-    
+    # Nothing is lost: every change is already in the journal, which
+    # gets replayed on top of the CSV
     load_library()
-    changes_made = False
 
 def exit_program():
     """Exit the program"""
-    global changes_made
-    
-    if changes_made:
-        print("\nYou have unsaved changes!")
-        save = input("Save before exiting? (y/n): ").lower()
-        if save == 'y':
-            save_library()
+    # Fold the journal into the CSV so the next start loads quickly
+    wait_for_compaction()
+    if my_library.has_changes():
+        save_library()
+    close_journal()
+    if DB_FILE:
+        my_library.close()
+    if shared['reader'] is not None:
+        shared['reader'].close()
+    if lock['file'] is not None:
+        lock['file'].close()
     
     print("\nThanks for using My Personal Library!")
     print("Goodbye!")
-main()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="My Personal Library")
+    parser.add_argument('--sqlite', nargs='?', const=DEFAULT_DB_FILE, metavar='DB_FILE',
+                        help=f"keep the library in an SQLite database (default {DEFAULT_DB_FILE}) instead of the CSV")
+    DB_FILE = parser.parse_args().sqlite
+    main()
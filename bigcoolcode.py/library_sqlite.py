@@ -0,0 +1,298 @@
+#DU P1 Larose PERSONAL LIBRARY / library_sqlite.py
+# SQLite storage for library_manager.py (run it with --sqlite)
+
+import sqlite3
+
+from library_item import Item
+from text_search import FIELD_WEIGHTS, MIN_PREFIX, tokenize
+
+# Text columns that can be searched and matched without caring about case
+TEXT_FIELDS = ['title', 'creator', 'genre']
+
+# How many rows iterating over the library reads at a time
+ITER_BATCH = 500
+
+# ORDER BY for each field sorted_items can sort by. Blank years ('') are
+# text, so they go first like Item's NO_YEAR.
+SORT_ORDERS = {
+    'title': ['title COLLATE NOCASE'],
+    'year': ["typeof(year) = 'integer'", 'year'],
+    'rating': ['CAST(rating AS REAL)'],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL DEFAULT '',
+    creator TEXT NOT NULL DEFAULT '',
+    year,
+    genre TEXT NOT NULL DEFAULT '',
+    format TEXT NOT NULL DEFAULT '',
+    rating TEXT NOT NULL DEFAULT '',
+    notes TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS items_title ON items (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS items_creator ON items (creator COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS items_genre ON items (genre COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS items_year ON items (year);
+CREATE INDEX IF NOT EXISTS items_rating ON items (CAST(rating AS REAL));
+"""
+
+# Full-text index for ranked_search, kept up to date by triggers
+TEXT_COLUMNS = list(FIELD_WEIGHTS)
+TEXT_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS items_text USING fts5(
+    {', '.join(TEXT_COLUMNS)}, content='items', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS items_text_add AFTER INSERT ON items BEGIN
+    INSERT INTO items_text (rowid, {', '.join(TEXT_COLUMNS)})
+    VALUES (new.id, {', '.join('new.' + column for column in TEXT_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS items_text_delete AFTER DELETE ON items BEGIN
+    INSERT INTO items_text (items_text, rowid, {', '.join(TEXT_COLUMNS)})
+    VALUES ('delete', old.id, {', '.join('old.' + column for column in TEXT_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS items_text_update AFTER UPDATE ON items BEGIN
+    INSERT INTO items_text (items_text, rowid, {', '.join(TEXT_COLUMNS)})
+    VALUES ('delete', old.id, {', '.join('old.' + column for column in TEXT_COLUMNS)});
+    INSERT INTO items_text (rowid, {', '.join(TEXT_COLUMNS)})
+    VALUES (new.id, {', '.join('new.' + column for column in TEXT_COLUMNS)});
+END;
+"""
+
+class SqliteLibrary:
+    """Library items kept in an SQLite database instead of in memory
+
+    Works like library_manager.Library (add/get/update/delete/find/search/
+    page), but every change is written to the database straight away and
+    only the rows asked for are ever read, so memory use doesn't grow with
+    the library.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # isolation_level=None: every statement commits on its own unless
+        # we start a transaction ourselves (see add_many)
+        self.connection = sqlite3.connect(filename, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        # WAL lets readers carry on while we write, and NORMAL sync is
+        # still crash safe in WAL mode
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.has_text_index = self.create_text_index()
+
+        # Called as listener(op, item_id, data) after every add/update/delete
+        self.listener = None
+
+    def create_text_index(self):
+        """Set up the full-text index, returns False if SQLite has no FTS5"""
+        found = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'items_text'").fetchone()
+        try:
+            self.connection.executescript(TEXT_SCHEMA)
+        except sqlite3.OperationalError:
+            return False
+        if found is None:
+            # Index the items that were there before the index was
+            self.connection.execute("INSERT INTO items_text (items_text) VALUES ('rebuild')")
+        return True
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def __bool__(self):
+        # Cheaper than counting every row
+        return self.connection.execute("SELECT 1 FROM items LIMIT 1").fetchone() is not None
+
+    def __iter__(self):
+        cursor = None
+        while True:
+            items, cursor = self.page(cursor, ITER_BATCH)
+            yield from items
+            if cursor is None:
+                return
+
+    @staticmethod
+    def clean(item):
+        """The columns we store (blank year and rating are '' like in the CSV)"""
+        if not isinstance(item, Item):
+            item = Item.from_row(item)
+        row = item.to_row()
+        del row['id']
+        return row
+
+    @staticmethod
+    def row_item(row):
+        return Item.from_row(dict(row))
+
+    def add(self, item, item_id=None):
+        """Add an item (an Item or a dict) and return its id
+
+        A new id is picked if none is given.
+        """
+        if not isinstance(item, Item):
+            item = Item.from_row(item)
+        row = self.clean(item)
+        if item_id is not None and self.get(item_id) is None:
+            row['id'] = item_id
+        columns = ', '.join(row)
+        marks = ', '.join('?' * len(row))
+        cursor = self.connection.execute(f"INSERT INTO items ({columns}) VALUES ({marks})", list(row.values()))
+        item_id = cursor.lastrowid
+        item.id = item_id
+        if self.listener:
+            self.listener('add', item_id, item)
+        return item_id
+
+    def add_many(self, items):
+        """Add a lot of items in one transaction (much faster than one by one)"""
+        ids = []
+        self.connection.execute("BEGIN")
+        try:
+            for item in items:
+                if not isinstance(item, Item):
+                    item = Item.from_row(item)
+                ids.append(self.add(item, item.id or None))
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+        return ids
+
+    def get(self, item_id):
+        """Get an item by id (None if there isn't one)"""
+        row = self.connection.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+        return self.row_item(row) if row is not None else None
+
+    def update(self, item_id, changes):
+        """Change some fields of an item"""
+        item = self.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        # Convert the new values the same way Item does
+        item.update(changes)
+        row = self.clean(item)
+        fields = [field for field in changes if field in row]
+        if fields:
+            assignments = ', '.join(f"{field} = ?" for field in fields)
+            self.connection.execute(f"UPDATE items SET {assignments} WHERE id = ?",
+                                    [row[field] for field in fields] + [item_id])
+        if self.listener:
+            self.listener('update', item_id, changes)
+
+    def delete(self, item_id):
+        """Remove an item by id and return it"""
+        item = self.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        self.connection.execute("DELETE FROM items WHERE id = ?", (item_id,))
+        if self.listener:
+            self.listener('delete', item_id, None)
+        return item
+
+    # Every change is already in the database, so there is never anything
+    # left to save
+    def has_changes(self):
+        return False
+
+    def take_changes(self):
+        return set(), set()
+
+    def restore_changes(self, changes):
+        pass
+
+    def page(self, cursor, limit):
+        """Up to limit items after cursor, in id order
+
+        Returns (items, next cursor), with None as the next cursor on the
+        last page. The cursor is the last id shown, so each page is one
+        indexed lookup however far in we are (unlike OFFSET).
+        """
+        rows = self.connection.execute("SELECT * FROM items WHERE id > ? ORDER BY id LIMIT ?",
+                                       (cursor or 0, limit + 1)).fetchall()
+        items = [self.row_item(row) for row in rows[:limit]]
+        if len(rows) > limit:
+            return items, items[-1].id
+        return items, None
+
+    def sorted_items(self, field, reverse=False, years=None, min_rating=None):
+        """Items in order of field, optionally only ones with a year from
+        years = (first, last) (either can be None) and rated min_rating or more
+
+        Reads ITER_BATCH rows at a time, like iterating over the library.
+        """
+        conditions = []
+        params = []
+        if years is not None:
+            first, last = years
+            conditions.append("typeof(year) = 'integer'")
+            if first is not None:
+                conditions.append("year >= ?")
+                params.append(first)
+            if last is not None:
+                conditions.append("year <= ?")
+                params.append(last)
+        if min_rating is not None:
+            conditions.append("rating != '' AND CAST(rating AS REAL) >= ?")
+            params.append(min_rating)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = " DESC" if reverse else ""
+        order = ', '.join(term + direction for term in SORT_ORDERS[field] + ['id'])
+        query = f"SELECT * FROM items {where} ORDER BY {order} LIMIT ? OFFSET ?"
+
+        offset = 0
+        while True:
+            rows = self.connection.execute(query, params + [ITER_BATCH, offset]).fetchall()
+            for row in rows:
+                yield self.row_item(row)
+            if len(rows) < ITER_BATCH:
+                return
+            offset += len(rows)
+
+    def find(self, field, value):
+        """Items whose field exactly matches value (ignoring case)"""
+        value = str(value).strip()
+        if field == 'year':
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+            query = "SELECT * FROM items WHERE year = ? ORDER BY id"
+        elif field in TEXT_FIELDS:
+            query = f"SELECT * FROM items WHERE {field} = ? COLLATE NOCASE ORDER BY id"
+        else:
+            raise KeyError(field)
+        return [self.row_item(row) for row in self.connection.execute(query, (value,))]
+
+    def search(self, text):
+        """Items with text anywhere in their title, creator, genre or year"""
+        text = str(text).strip()
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        checks = [f"{field} LIKE ? ESCAPE '\\'" for field in TEXT_FIELDS]
+        checks.append("CAST(year AS TEXT) LIKE ? ESCAPE '\\'")
+        query = f"SELECT * FROM items WHERE {' OR '.join(checks)} ORDER BY id"
+        return [self.row_item(row) for row in self.connection.execute(query, [pattern] * len(checks))]
+
+    def ranked_search(self, text, limit=20):
+        """The best limit items with every word of text in any field
+
+        Words also match longer words they start, ranked with SQLite's
+        BM25 using the same field weights as text_search.
+        """
+        words = tokenize(text)
+        if not words:
+            return []
+        if not self.has_text_index:
+            return self.search(text)[:limit]
+        # Short words only match whole words, like in TextIndex.expand
+        query = ' '.join(f'"{word}"*' if len(word) >= MIN_PREFIX else f'"{word}"' for word in words)
+        weights = ', '.join(str(FIELD_WEIGHTS[column]) for column in TEXT_COLUMNS)
+        rows = self.connection.execute(
+            f"SELECT items.* FROM items_text JOIN items ON items.id = items_text.rowid "
+            f"WHERE items_text MATCH ? ORDER BY bm25(items_text, {weights}), items.id LIMIT ?",
+            (query, limit))
+        return [self.row_item(row) for row in rows]
@@ -21,9 +21,9 @@ def main():
             if filename == "":
                 filename = input("Enter the exact file path for your document: ")
             
-            # Update word count and timestamp
-            content = file_handling.read_file(filename)
-            word_count = file_handling.count_words(content)
+            # Update word count and timestamp (only the parts of the
+            # document that changed since the last update are counted)
+            word_count = file_handling.count_file_words(filename)
             timestamp = time_handling.get_current_time()
             file_handling.update_file_info(filename, word_count, timestamp)
             print(f"Document updated. Word count: {word_count}")
@@ -57,8 +57,9 @@ def main():
                 lines.pop()
                 
             new_content = "\n".join(lines)
-            file_handling.append_to_file(filename, new_content)
-            print("Content added successfully.")
+            timestamp = time_handling.get_current_time()
+            word_count = file_handling.append_to_file(filename, new_content, timestamp)
+            print(f"Content added successfully. Word count: {word_count}")
             
         elif choice == "4":
             print("Goodbye!")
@@ -0,0 +1,202 @@
+#DU P1 Larose PERSONAL LIBRARY / text_search.py
+# Ranked full-text search over library items
+
+import re
+from bisect import bisect_left, insort
+from heapq import nsmallest
+from itertools import groupby
+from math import log
+
+# Fields that are searched, and how much a word in each one counts
+# (a word in the title matters more than the same word in the notes)
+FIELD_WEIGHTS = {'title': 3, 'creator': 2, 'genre': 1, 'year': 1, 'format': 1, 'notes': 1}
+
+# BM25 settings: K1 is how quickly repeating a word stops helping,
+# B is how much long items are marked down
+K1 = 1.2
+B = 0.75
+
+# Search words shorter than this only match whole words (a short prefix
+# like "a" would match a big part of the vocabulary)
+MIN_PREFIX = 3
+
+# Most vocabulary words one search word can stand for as a prefix
+MAX_EXPANSIONS = 50
+
+WORD = re.compile(r"\w+")
+
+def tokenize(text):
+    """Split text into lowercase words"""
+    return WORD.findall(str(text).lower())
+
+class TextIndex:
+    """Inverted index of words -> {(weighted count, item length): item ids}
+
+    Items with the same count of a word and the same length get the same
+    BM25 score for that word, so each word's items are kept in a few of
+    these groups. A search then scores groups instead of items, and uses
+    set operations to combine words, which keeps it fast even when a word
+    is in most of the library.
+
+    Items are added, updated and removed one at a time, so the index never
+    needs rebuilding. The vocabulary is also kept sorted, so a search word
+    also matches every word it is the start of ("tolk" finds "tolkien").
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+        self.count = 0
+        self.total_length = 0
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def item_words(item):
+        """{word: weighted count} for an item"""
+        counts = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            # Skips blanks, and Item's NO_YEAR
+            value = item.get(field)
+            if not value:
+                continue
+            for word in tokenize(value):
+                counts[word] = counts.get(word, 0) + weight
+        return counts
+
+    def add(self, item_id, item, keep_sorted=True):
+        """Index an item
+
+        With keep_sorted=False new words go on the end of the vocabulary,
+        which is much faster when adding lots of items, but then
+        sort_vocabulary must be called before searching.
+        """
+        counts = self.item_words(item)
+        length = sum(counts.values())
+        for word, count in counts.items():
+            groups = self.postings.get(word)
+            if groups is None:
+                groups = self.postings[word] = {}
+                if keep_sorted:
+                    insort(self.vocabulary, word)
+                else:
+                    self.vocabulary.append(word)
+            groups.setdefault((count, length), set()).add(item_id)
+        self.count += 1
+        self.total_length += length
+
+    def sort_vocabulary(self):
+        self.vocabulary.sort()
+
+    def remove(self, item_id, item):
+        """Remove an item (item must be what was added, before any changes)"""
+        counts = self.item_words(item)
+        length = sum(counts.values())
+        for word, count in counts.items():
+            groups = self.postings[word]
+            ids = groups[count, length]
+            ids.discard(item_id)
+            if not ids:
+                del groups[count, length]
+                if not groups:
+                    del self.postings[word]
+                    del self.vocabulary[bisect_left(self.vocabulary, word)]
+        self.count -= 1
+        self.total_length -= length
+
+    def expand(self, word):
+        """Vocabulary words starting with word (the exact word first)"""
+        if len(word) < MIN_PREFIX:
+            return [word] if word in self.postings else []
+        start = bisect_left(self.vocabulary, word)
+        words = []
+        for term in self.vocabulary[start:start + MAX_EXPANSIONS]:
+            if not term.startswith(word):
+                break
+            words.append(term)
+        return words
+
+    def scored_groups(self, word):
+        """[(BM25 score, item ids)] for one search word, best first"""
+        average = self.total_length / self.count
+        scored = []
+        for term in self.expand(word):
+            groups = self.postings[term]
+            matches = sum(len(ids) for ids in groups.values())
+            idf = log(1 + (self.count - matches + 0.5) / (matches + 0.5))
+            for (count, length), ids in groups.items():
+                norm = K1 * (1 - B + B * length / average)
+                scored.append((idf * count * (K1 + 1) / (count + norm), ids))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored
+
+    def search(self, text, limit=20):
+        """Ids of the best limit items containing every word of text
+
+        Returns [(score, item id)], best first (lowest id first on ties).
+        """
+        words = list(dict.fromkeys(tokenize(text)))
+        if not words or not self.count:
+            return []
+
+        scored = [self.scored_groups(word) for word in words]
+        if len(words) == 1:
+            return self.best_of(scored[0], limit)
+
+        # Items with every word: start from the rarest word and only ever
+        # intersect with what is still left
+        scored.sort(key=lambda groups: sum(len(ids) for score, ids in groups))
+        found = set().union(*(ids for score, ids in scored[0]))
+        for groups in scored[1:]:
+            found = set().union(*(ids & found for score, ids in groups))
+            if not found:
+                return []
+
+        # Split the found items by total score: each word splits them into
+        # a few groups, and a total is one group from every word
+        totals = self.split_by_score(scored[0], found)
+        for groups in scored[1:]:
+            combined = {}
+            for word_score, word_ids in self.split_by_score(groups, found).items():
+                for score, ids in totals.items():
+                    both = ids & word_ids
+                    if both:
+                        combined.setdefault(score + word_score, set()).update(both)
+            totals = combined
+        return self.best_of(sorted(totals.items(), reverse=True), limit)
+
+    @staticmethod
+    def split_by_score(scored, found):
+        """{score: item ids} for the items in found
+
+        A prefix can match several words in one item, so each item is put
+        under the best score it has.
+        """
+        split = {}
+        left = set(found)
+        for score, ids in scored:
+            ids = ids & left
+            if ids:
+                left -= ids
+                split.setdefault(score, set()).update(ids)
+                if not left:
+                    break
+        return split
+
+    @staticmethod
+    def best_of(scored, limit):
+        """Top limit (score, item id) from groups sorted best first"""
+        results = []
+        seen = set()
+        for score, same in groupby(scored, key=lambda pair: pair[0]):
+            same = [ids for _, ids in same]
+            ids = same[0] if len(same) == 1 else set().union(*same)
+            if seen:
+                ids = ids - seen
+            for item_id in nsmallest(limit - len(results), ids):
+                results.append((score, item_id))
+            if len(results) >= limit:
+                break
+            seen |= ids
+        return results
@@ -1,39 +1,186 @@
 # DU Larose P1
 # Movie recommender
 
+import argparse
 import csv
+import io
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from heapq import merge, nsmallest
 
-def load_movies(filename):
+# NumPy and SciPy make "more like this" much faster but aren't required
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+# Index of the loaded movies so searches don't have to scan every movie
+# It gets rebuilt every time load_movies runs
+movie_index = {}
+
+# Length of the pieces used to find substrings in the index
+NGRAM_SIZE = 3
+
+# Lengths are kept in array('i') columns, so anything outside this range
+# is treated as unknown (0), the same as a length that isn't a number
+MIN_LENGTH = -2 ** 31
+MAX_LENGTH = 2 ** 31 - 1
+
+# Recent search results, keyed on the cleaned up filters
+# policy 'lru' drops the least recently used search when full, 'fifo' the oldest one
+result_cache = {
+    'entries': OrderedDict(),
+    'size': 128,
+    'policy': 'lru',
+    'index': None,
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0,
+}
+# The query server searches from several threads at once, so the cache is
+# only looked at and changed with this held (the searches themselves aren't)
+cache_lock = threading.RLock()
+
+# "More like this" settings: how many similar movies to keep for each movie
+# and how many minutes go in one length bucket
+SIMILAR_COUNT = 5
+LENGTH_BUCKET = 30
+# Biggest catalog to work out every movie's neighbours for at startup
+PRECOMPUTE_LIMIT = 20_000
+
+# How many movies print_movies shows on one page
+PAGE_SIZE = 20
+
+# Similarity data for the loaded movies. It takes a while to make and
+# a lot of sessions never look at a movie's details, so build_similarity
+# only runs the first time show_similar needs it for similarity_movies.
+similarity_engine = None
+similarity_movies = None
+
+# Binary snapshot of the parsed movies and their search index, saved next
+# to the CSV file. It's a plain cache: read in one go and turned back into
+# arrays and dicts, which is much quicker than parsing and indexing again.
+SNAPSHOT_EXTENSION = '.snapshot'
+SNAPSHOT_MAGIC = b'MOVSNAP2'
+# magic, byte order, CSV size, CSV modified time (ns)
+SNAPSHOT_HEADER = struct.Struct('<8s1sqq')
+# typecode, number of bytes that follow
+SECTION_HEADER = struct.Struct('<1sQ')
+
+def check_text(row):
+    # Files are read with errors='surrogateescape', so bytes that aren't
+    # UTF-8 end up as lone surrogates and only spoil the row they are in
+    for value in row.values():
+        if isinstance(value, str) and not value.isascii():
+            try:
+                value.encode('utf-8')
+            except UnicodeEncodeError:
+                raise ValueError("not valid UTF-8 text") from None
+
+def parse_movie(row):
+    # Turn one CSV row into a clean movie dict
+    check_text(row)
+    movie = {}
+    movie['title'] = row['Title'].strip()
+    movie['director'] = row['Director'].strip()
+    
+    # Split genres by / and clean them
+    genres = row['Genre'].split('/')
+    movie['genres'] = [g.strip().lower() for g in genres]
+    
+    movie['rating'] = row['Rating'].strip()
+    
+    # Convert length to integer
+    try:
+        movie['length'] = int(row['Length (min)'])
+    except:
+        movie['length'] = 0
+    if not MIN_LENGTH <= movie['length'] <= MAX_LENGTH:
+        movie['length'] = 0
+    
+    # Split actors by comma and clean them
+    actors = row['Notable Actors'].split(',')
+    movie['actors'] = [a.strip().lower() for a in actors]
+    return movie
+
+def read_movies(filename):
+    # Read the CSV file one movie at a time
+    with open(filename, 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield parse_movie(row)
+
+def stream_movies(filename, chunk_size=1000, compact=False, bad_rows=None):
+    # Load movies a chunk at a time and keep the search index up to date
+    # Yields (movies, chunk): the catalog so far and the movies just added,
+    # so searches can already run before a huge file has finished loading
+    # Rows that can't be read are added to bad_rows as (line number, error)
+    # instead of stopping the whole load
+    global movie_index
+    movies = MovieTable() if compact else []
+    movie_index = new_index(movies)
+    chunk = []
+    yielded = False
+
+    with open(filename, 'r', encoding='utf-8', errors='surrogateescape') as file:
+        reader = csv.DictReader(file)
+        while True:
+            try:
+                row = next(reader)
+                movie = parse_movie(row)
+                movie_id = len(movies)
+                if compact:
+                    movies.add(movie)
+                else:
+                    movies.append(movie)
+                index_movie(movie_index, movie_id, movie)
+            except StopIteration:
+                break
+            except Exception as e:
+                if bad_rows is not None:
+                    bad_rows.append((reader.line_num, str(e)))
+                continue
+            chunk.append(movie)
+
+            if len(chunk) >= chunk_size:
+                # Searches cached before this chunk are missing its movies
+                clear_cache()
+                yield movies, chunk
+                yielded = True
+                chunk = []
+
+    # Sort the last lengths now rather than on the first search
+    update_length_index(movie_index)
+    if chunk or not yielded:
+        clear_cache()
+        yield movies, chunk
+
+def load_movies(filename, compact=False, workers=1):
     # Load movies from CSV file
-    movies = []
+    # compact=True stores them in a MovieTable instead of a list of dicts
+    # workers > 1 parses the file in that many processes at once
     try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Clean up the data
-                movie = {}
-                movie['title'] = row['Title'].strip()
-                movie['director'] = row['Director'].strip()
-                
-                # Split genres by / and clean them
-                genres = row['Genre'].split('/')
-                movie['genres'] = [g.strip().lower() for g in genres]
-                
-                movie['rating'] = row['Rating'].strip()
-                
-                # Convert length to integer
-                try:
-                    movie['length'] = int(row['Length (min)'])
-                except:
-                    movie['length'] = 0
-                
-                # Split actors by comma and clean them
-                actors = row['Notable Actors'].split(',')
-                movie['actors'] = [a.strip().lower() for a in actors]
-                
-                movies.append(movie)
-        
+        bad_rows = []
+        if workers > 1:
+            movies = load_movies_parallel(filename, workers, compact=compact, bad_rows=bad_rows)
+        else:
+            for movies, chunk in stream_movies(filename, chunk_size=10000, compact=compact, bad_rows=bad_rows):
+                pass
+
         print(f"Loaded {len(movies)} movies from {filename}")
+        if bad_rows:
+            print(f"Skipped {len(bad_rows)} bad rows (first one on line {bad_rows[0][0]}: {bad_rows[0][1]})")
         return movies
     
     except FileNotFoundError:
@@ -44,6 +191,659 @@ def load_movies(filename):
         print(f"Error loading movies: {e}")
         return []
 
+def split_csv(filename, pieces):
+    # Split the CSV into byte ranges that each start at the beginning of a row
+    # Returns the header line and a list of (start, end) byte offsets
+    # (Assumes no line breaks inside quoted fields, which movies.csv never has)
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as file:
+        header = file.readline()
+        data_start = file.tell()
+        bounds = [data_start]
+
+        for i in range(1, pieces):
+            target = data_start + (size - data_start) * i // pieces
+            if target <= bounds[-1]:
+                continue
+            # Move forward to the start of the next row
+            file.seek(target - 1)
+            file.readline()
+            position = file.tell()
+            if bounds[-1] < position < size:
+                bounds.append(position)
+
+    bounds.append(size)
+    ranges = [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+    return header, ranges
+
+def parse_csv_piece(filename, header, start, end, compact):
+    # Parse one byte range of the CSV (runs in a worker process)
+    # Returns (movies, bad rows, number of lines in the piece)
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8', errors='surrogateescape')
+
+    fieldnames = next(csv.reader([header.decode('utf-8', errors='surrogateescape')]))
+    reader = csv.DictReader(io.StringIO(text), fieldnames=fieldnames)
+    movies = MovieTable() if compact else []
+    bad_rows = []
+    for row in reader:
+        try:
+            movie = parse_movie(row)
+            if compact:
+                movies.add(movie)
+            else:
+                movies.append(movie)
+        except Exception as e:
+            bad_rows.append((reader.line_num, str(e)))
+    return movies, bad_rows, text.count('\n')
+
+def load_movies_parallel(filename, workers, compact=False, bad_rows=None):
+    # Parse the CSV in several processes and merge the pieces in file order
+    global movie_index
+    header, ranges = split_csv(filename, workers)
+    movies = MovieTable() if compact else []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_csv_piece, filename, header, start, end, compact)
+                   for start, end in ranges]
+
+        # Line 1 is the header, so the first piece starts on line 2
+        first_line = 2
+        for future in futures:
+            piece, piece_bad_rows, line_count = future.result()
+            movies.extend(piece)
+            if bad_rows is not None:
+                for line, error in piece_bad_rows:
+                    bad_rows.append((first_line + line - 1, error))
+            first_line += line_count
+
+    movie_index = build_index(movies)
+    return movies
+
+class MovieRow:
+    # One movie inside a MovieTable
+    # Works like a movie dict (movie['title'], 'genres' in movie, ...)
+    # so print_movies and show_movie_details don't need to change
+    __slots__ = ('table', 'movie_id')
+
+    def __init__(self, table, movie_id):
+        self.table = table
+        self.movie_id = movie_id
+
+    def __getitem__(self, key):
+        return self.table.get_field(self.movie_id, key)
+
+    def __contains__(self, key):
+        return key in MovieTable.FIELDS
+
+    def get(self, key, default=None):
+        if key in MovieTable.FIELDS:
+            return self[key]
+        return default
+
+    def keys(self):
+        return MovieTable.FIELDS
+
+class MovieTable:
+    # Column based movie storage that uses much less memory than a dict per movie
+    # Genres, actors, directors and ratings are stored once in a vocabulary
+    # and each movie only keeps int ids into it. Genres and actors can have
+    # several values per movie, so offsets[i]:offsets[i + 1] gives movie i's ids.
+    FIELDS = ('title', 'director', 'genres', 'rating', 'length', 'actors')
+    ARRAY_COLUMNS = ('director_ids', 'rating_ids', 'lengths', 'genre_ids',
+                     'genre_offsets', 'actor_ids', 'actor_offsets')
+
+    def __init__(self):
+        self.titles = []
+        self.director_ids = array('i')
+        self.rating_ids = array('i')
+        self.lengths = array('i')
+        self.genre_ids = array('i')
+        self.genre_offsets = array('i', [0])
+        self.actor_ids = array('i')
+        self.actor_offsets = array('i', [0])
+
+        # Vocabularies: list of values plus value -> id lookup
+        self.directors = []
+        self.ratings = []
+        self.genres = []
+        self.actors = []
+        self.vocab_lookup = {'director': {}, 'rating': {}, 'genre': {}, 'actor': {}}
+
+    @classmethod
+    def from_movies(cls, movies):
+        # Build a table from any list (or generator) of movie dicts
+        table = cls()
+        for movie in movies:
+            table.add(movie)
+        return table
+
+    def rebuild_lookups(self):
+        # Rebuild the value -> id lookups from the vocabulary lists
+        for field, values in (('director', self.directors), ('rating', self.ratings),
+                              ('genre', self.genres), ('actor', self.actors)):
+            self.vocab_lookup[field] = {value: i for i, value in enumerate(values)}
+
+    def vocab_id(self, field, values, value):
+        # Get the id of a value, adding it to the vocabulary if it's new
+        lookup = self.vocab_lookup[field]
+        value_id = lookup.get(value)
+        if value_id is None:
+            value_id = len(values)
+            lookup[value] = value_id
+            values.append(value)
+        return value_id
+
+    def add(self, movie):
+        # Add one movie dict to the end of the table
+        # The length goes in first: it's the only column that can refuse a
+        # value, and then no other column is left a row ahead
+        self.lengths.append(movie['length'])
+        self.titles.append(movie['title'])
+        self.director_ids.append(self.vocab_id('director', self.directors, movie['director']))
+        self.rating_ids.append(self.vocab_id('rating', self.ratings, movie['rating']))
+
+        for genre in movie['genres']:
+            self.genre_ids.append(self.vocab_id('genre', self.genres, genre))
+        self.genre_offsets.append(len(self.genre_ids))
+
+        for actor in movie['actors']:
+            self.actor_ids.append(self.vocab_id('actor', self.actors, actor))
+        self.actor_offsets.append(len(self.actor_ids))
+
+    def extend(self, other):
+        # Add every movie from another MovieTable to the end of this one
+        # Only the vocabularies need mapping, the id columns are copied in bulk
+        maps = {}
+        for field, values, other_values in (('director', self.directors, other.directors),
+                                            ('rating', self.ratings, other.ratings),
+                                            ('genre', self.genres, other.genres),
+                                            ('actor', self.actors, other.actors)):
+            maps[field] = [self.vocab_id(field, values, value) for value in other_values]
+
+        self.titles.extend(other.titles)
+        self.director_ids.extend(array('i', [maps['director'][i] for i in other.director_ids]))
+        self.rating_ids.extend(array('i', [maps['rating'][i] for i in other.rating_ids]))
+        self.lengths.extend(other.lengths)
+
+        genre_base = len(self.genre_ids)
+        self.genre_ids.extend(array('i', [maps['genre'][i] for i in other.genre_ids]))
+        self.genre_offsets.extend(array('i', [genre_base + o for o in other.genre_offsets[1:]]))
+
+        actor_base = len(self.actor_ids)
+        self.actor_ids.extend(array('i', [maps['actor'][i] for i in other.actor_ids]))
+        self.actor_offsets.extend(array('i', [actor_base + o for o in other.actor_offsets[1:]]))
+
+    def get_field(self, movie_id, key):
+        # Read one field of one movie
+        if key == 'title':
+            return self.titles[movie_id]
+        elif key == 'director':
+            return self.directors[self.director_ids[movie_id]]
+        elif key == 'rating':
+            return self.ratings[self.rating_ids[movie_id]]
+        elif key == 'length':
+            return self.lengths[movie_id]
+        elif key == 'genres':
+            start, end = self.genre_offsets[movie_id], self.genre_offsets[movie_id + 1]
+            return [self.genres[g] for g in self.genre_ids[start:end]]
+        elif key == 'actors':
+            start, end = self.actor_offsets[movie_id], self.actor_offsets[movie_id + 1]
+            return [self.actors[a] for a in self.actor_ids[start:end]]
+        raise KeyError(key)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, movie_id):
+        if movie_id < 0:
+            movie_id += len(self)
+        if not 0 <= movie_id < len(self):
+            raise IndexError("movie id out of range")
+        return MovieRow(self, movie_id)
+
+    def __iter__(self):
+        for movie_id in range(len(self)):
+            yield MovieRow(self, movie_id)
+
+def snapshot_path(filename):
+    # The snapshot lives next to the CSV, e.g. movies.csv.snapshot
+    return filename + SNAPSHOT_EXTENSION
+
+def csv_signature(filename):
+    # Size and modified time tell us if the CSV changed since the snapshot
+    info = os.stat(filename)
+    return info.st_size, info.st_mtime_ns
+
+def write_section(file, typecode, data):
+    # Write one block of raw bytes with a small header in front
+    file.write(SECTION_HEADER.pack(typecode.encode(), len(data)))
+    file.write(data)
+
+def write_strings(file, strings):
+    # Strings are stored as one UTF-8 blob plus the offset where each one ends
+    encoded = [text.encode('utf-8') for text in strings]
+    offsets = array('q')
+    total = 0
+    for data in encoded:
+        total += len(data)
+        offsets.append(total)
+    write_section(file, 'q', offsets.tobytes())
+    write_section(file, 'B', b''.join(encoded))
+
+def write_groups(file, groups):
+    # Lists of movie ids (or term numbers) are stored as one flat array plus
+    # the offset where each list ends
+    offsets = array('q')
+    flat = array('i')
+    for group in groups:
+        flat.extend(group)
+        offsets.append(len(flat))
+    write_section(file, 'q', offsets.tobytes())
+    write_section(file, 'i', flat.tobytes())
+
+def write_index(file, index):
+    # Save the posting lists, n-grams and sorted lengths of an index
+    update_length_index(index)
+    for field in ('genre', 'director', 'actor'):
+        field_index = index[field]
+        terms = list(field_index['postings'])
+        write_strings(file, terms)
+        write_groups(file, (field_index['postings'][term] for term in terms))
+
+        # N-grams point at terms by their position in the list above
+        term_numbers = {term: i for i, term in enumerate(terms)}
+        grams = list(field_index['ngrams'])
+        write_strings(file, grams)
+        write_groups(file, ([term_numbers[term] for term in field_index['ngrams'][gram]] for gram in grams))
+
+    write_section(file, 'i', index['lengths'].tobytes())
+    write_section(file, 'i', index['length_ids'].tobytes())
+
+def save_snapshot(table, filename, index=None, signature=None):
+    # Save a MovieTable (and its search index) so the next start can skip
+    # parsing the CSV and building the index
+    # signature is the csv_signature the table was parsed from (read it
+    # before parsing, a CSV rewritten since must not get this snapshot)
+    if index is None or index.get('movies') is not table:
+        index = build_index(table)
+    if signature is None:
+        signature = csv_signature(filename)
+    path = snapshot_path(filename)
+    temp_path = path + '.tmp'
+    size, mtime = signature
+    byte_order = b'L' if sys.byteorder == 'little' else b'B'
+
+    with open(temp_path, 'wb') as file:
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, byte_order, size, mtime))
+        for strings in (table.titles, table.directors, table.ratings, table.genres, table.actors):
+            write_strings(file, strings)
+        for column in MovieTable.ARRAY_COLUMNS:
+            values = getattr(table, column)
+            write_section(file, values.typecode, values.tobytes())
+        write_index(file, index)
+
+    # Swap the new file in at once so a crash never leaves half a snapshot
+    os.replace(temp_path, path)
+
+def read_section(data, pos):
+    # Read one block written by write_section, returns (typecode, bytes, next position)
+    typecode, length = SECTION_HEADER.unpack_from(data, pos)
+    pos += SECTION_HEADER.size
+    return typecode.decode(), data[pos:pos + length], pos + length
+
+def read_array(data, pos):
+    # Read one section back into an array
+    typecode, raw, pos = read_section(data, pos)
+    values = array(typecode)
+    values.frombytes(raw)
+    return values, pos
+
+def read_strings(data, pos):
+    # Read a list of strings written by write_strings
+    offsets, pos = read_array(data, pos)
+    typecode, blob, pos = read_section(data, pos)
+
+    strings = []
+    start = 0
+    for end in offsets:
+        strings.append(str(blob[start:end], 'utf-8'))
+        start = end
+    return strings, pos
+
+def read_groups(data, pos):
+    # Read the lists written by write_groups (each one is an array slice)
+    offsets, pos = read_array(data, pos)
+    flat, pos = read_array(data, pos)
+
+    groups = []
+    start = 0
+    for end in offsets:
+        groups.append(flat[start:end])
+        start = end
+    return groups, pos
+
+def read_index(data, pos, movies):
+    # Read an index written by write_index
+    index = new_index(movies)
+    for field in ('genre', 'director', 'actor'):
+        terms, pos = read_strings(data, pos)
+        postings, pos = read_groups(data, pos)
+        grams, pos = read_strings(data, pos)
+        gram_terms, pos = read_groups(data, pos)
+        index[field]['postings'] = dict(zip(terms, postings))
+        index[field]['ngrams'] = {gram: set(map(terms.__getitem__, numbers))
+                                  for gram, numbers in zip(grams, gram_terms)}
+
+    index['lengths'], pos = read_array(data, pos)
+    index['length_ids'], pos = read_array(data, pos)
+    return index, pos
+
+def load_snapshot(filename):
+    # Load the snapshot for a CSV file, returns (movies, index)
+    # Returns None if there is no snapshot or the CSV changed since it was made
+    path = snapshot_path(filename)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        size, mtime = csv_signature(filename)
+        byte_order = b'L' if sys.byteorder == 'little' else b'B'
+
+        with open(path, 'rb') as file:
+            # A memoryview so each section is only copied once, into its array
+            data = memoryview(file.read())
+
+        magic, saved_order, saved_size, saved_mtime = SNAPSHOT_HEADER.unpack_from(data, 0)
+        if (magic, saved_order, saved_size, saved_mtime) != (SNAPSHOT_MAGIC, byte_order, size, mtime):
+            return None
+
+        table = MovieTable()
+        pos = SNAPSHOT_HEADER.size
+        table.titles, pos = read_strings(data, pos)
+        table.directors, pos = read_strings(data, pos)
+        table.ratings, pos = read_strings(data, pos)
+        table.genres, pos = read_strings(data, pos)
+        table.actors, pos = read_strings(data, pos)
+        for column in MovieTable.ARRAY_COLUMNS:
+            values, pos = read_array(data, pos)
+            setattr(table, column, values)
+        index, pos = read_index(data, pos, table)
+    except Exception:
+        # A broken snapshot just gets rebuilt
+        return None
+
+    table.rebuild_lookups()
+    return table, index
+
+def load_catalog(filename, workers=1):
+    # Load movies from the snapshot if it's up to date, otherwise parse the
+    # CSV and write a fresh snapshot for next time
+    global movie_index
+    snapshot = load_snapshot(filename)
+    if snapshot is None:
+        try:
+            signature = csv_signature(filename)
+        except OSError:
+            signature = None
+        movies = load_movies(filename, compact=True, workers=workers)
+        if movies:
+            try:
+                # If the CSV changed while we read it, what we have may be
+                # neither the old file nor the new one, so don't keep it
+                if csv_signature(filename) == signature:
+                    save_snapshot(movies, filename, movie_index, signature)
+            except OSError as e:
+                print(f"Could not save snapshot: {e}")
+        return movies
+
+    movies, movie_index = snapshot
+    print(f"Loaded {len(movies)} movies from {snapshot_path(filename)}")
+    return movies
+
+def get_ngrams(text):
+    # Break text into overlapping pieces, e.g. 'drama' -> 'dra', 'ram', 'ama'
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+def new_index(movies):
+    # Make an empty index for a list of movies
+    # Each field maps a term to a sorted list of movie ids (positions in movies)
+    # and each n-gram to the set of terms that contain it
+    index = {'movies': movies}
+
+    # Known lengths (> 0) sorted, with the matching movie ids in the same order
+    # New movies wait in pending_lengths until the next length search
+    index['lengths'] = array('i')
+    index['length_ids'] = array('i')
+    index['pending_lengths'] = []
+
+    for field in ('genre', 'director', 'actor'):
+        index[field] = {'postings': {}, 'ngrams': {}}
+    return index
+
+def add_term(field_index, term, movie_id):
+    # Add one movie id to the posting list of a term
+    postings = field_index['postings']
+    if term not in postings:
+        postings[term] = []
+        for gram in get_ngrams(term):
+            field_index['ngrams'].setdefault(gram, set()).add(term)
+
+    # Ids are always added in order so the list stays sorted
+    ids = postings[term]
+    if not ids or ids[-1] != movie_id:
+        ids.append(movie_id)
+
+def index_movie(index, movie_id, movie):
+    # Add one movie to the index
+    for genre in movie['genres']:
+        add_term(index['genre'], genre, movie_id)
+    add_term(index['director'], movie['director'].lower(), movie_id)
+    for actor in movie['actors']:
+        add_term(index['actor'], actor, movie_id)
+    if movie['length'] > 0:
+        index['pending_lengths'].append((movie['length'], movie_id))
+
+def build_index(movies):
+    # Build the genre/director/actor index for a list of movies
+    index = new_index(movies)
+    if isinstance(movies, MovieTable):
+        index_table(index, movies)
+    else:
+        for movie_id, movie in enumerate(movies):
+            index_movie(index, movie_id, movie)
+    update_length_index(index)
+    return index
+
+def index_table(index, table):
+    # Faster way to index a whole MovieTable: group the movie ids by
+    # vocabulary id using the id columns, then look up each term only once
+    columns = (('genre', table.genres, table.genre_ids, table.genre_offsets),
+               ('actor', table.actors, table.actor_ids, table.actor_offsets))
+    for field, values, value_ids, offsets in columns:
+        groups = [[] for value in values]
+        start = 0
+        for movie_id, end in enumerate(offsets[1:]):
+            for value_id in value_ids[start:end]:
+                group = groups[value_id]
+                if not group or group[-1] != movie_id:
+                    group.append(movie_id)
+            start = end
+        add_groups(index[field], values, groups)
+
+    groups = [[] for director in table.directors]
+    for movie_id, value_id in enumerate(table.director_ids):
+        groups[value_id].append(movie_id)
+    add_groups(index['director'], [director.lower() for director in table.directors], groups)
+
+    index['pending_lengths'] = [(length, i) for i, length in enumerate(table.lengths) if length > 0]
+
+def add_groups(field_index, terms, groups):
+    # Add sorted movie id lists for a list of terms to the index
+    postings = field_index['postings']
+    for term, group in zip(terms, groups):
+        if not group:
+            continue
+        if term in postings:
+            # Two values that only differ by case share one term
+            postings[term] = sorted(set(postings[term]) | set(group))
+            continue
+        postings[term] = group
+        for gram in get_ngrams(term):
+            field_index['ngrams'].setdefault(gram, set()).add(term)
+
+def update_length_index(index):
+    # Merge any new movie lengths into the sorted arrays so ranges can use
+    # binary search (only sorts the new ones, the rest is already in order)
+    pending = index['pending_lengths']
+    if not pending:
+        return
+    pending.sort()
+    known = merge(zip(index['lengths'], index['length_ids']), pending)
+    lengths = array('i')
+    ids = array('i')
+    for length, movie_id in known:
+        lengths.append(length)
+        ids.append(movie_id)
+    index['lengths'] = lengths
+    index['length_ids'] = ids
+    index['pending_lengths'] = []
+
+def length_range(index, min_length=None, max_length=None):
+    # Find where a length range starts and ends in the sorted lengths
+    update_length_index(index)
+    lengths = index['lengths']
+    start = 0 if min_length is None else bisect_left(lengths, min_length)
+    end = len(lengths) if max_length is None else bisect_right(lengths, max_length)
+    return start, max(start, end)
+
+def length_ids(index, min_length=None, max_length=None):
+    # Get the ids of every movie with a known length inside the range
+    start, end = length_range(index, min_length, max_length)
+    return index['length_ids'][start:end]
+
+def matching_terms(field_index, query):
+    # Find every term that contains the query (same as 'query in term')
+    if len(query) < NGRAM_SIZE:
+        # Too short for n-grams, so check the (much smaller) list of terms
+        return [term for term in field_index['postings'] if query in term]
+
+    # A term can only contain the query if it has all of the query's n-grams
+    # Start with the rarest n-gram so the candidate set stays small
+    gram_sets = []
+    for gram in get_ngrams(query):
+        terms = field_index['ngrams'].get(gram)
+        if not terms:
+            return []
+        gram_sets.append(terms)
+    gram_sets.sort(key=len)
+
+    candidates = set(gram_sets[0])
+    for terms in gram_sets[1:]:
+        candidates &= terms
+        if not candidates:
+            return []
+
+    # N-grams can match in the wrong order, so double check each term
+    return [term for term in candidates if query in term]
+
+def lookup_ids(index, field, query):
+    # Get the set of movie ids that match a genre/director/actor query
+    query = query.strip().lower()
+    field_index = index[field]
+    ids = set()
+    for term in matching_terms(field_index, query):
+        ids.update(field_index['postings'][term])
+    return ids
+
+def length_matches(length, min_length, max_length):
+    # Check one length against the range (0 or less means unknown)
+    if length <= 0:
+        return False
+    if min_length is not None and length < min_length:
+        return False
+    if max_length is not None and length > max_length:
+        return False
+    return True
+
+def movie_matches(movie, filter_type, filter_value):
+    # Check a single movie against one filter (same rules as filter_by_*)
+    if filter_type == 'genre':
+        query = filter_value.strip().lower()
+        return any(query in genre for genre in movie['genres'])
+    elif filter_type == 'director':
+        return filter_value.strip().lower() in movie['director'].lower()
+    elif filter_type == 'actor':
+        query = filter_value.strip().lower()
+        return any(query in actor for actor in movie['actors'])
+    elif filter_type == 'length':
+        min_len, max_len = filter_value
+        return length_matches(movie['length'], min_len, max_len)
+    return True
+
+def estimate_matches(index, filter_type, filter_value):
+    # Guess how many movies a filter will match using the catalog stats
+    # Returns the guess and the matching index terms (so we don't look twice)
+    if filter_type in ('genre', 'director', 'actor'):
+        field_index = index[filter_type]
+        terms = matching_terms(field_index, filter_value.strip().lower())
+        estimate = sum(len(field_index['postings'][term]) for term in terms)
+        return estimate, terms
+    elif filter_type == 'length':
+        start, end = length_range(index, *filter_value)
+        return end - start, None
+    # Unknown filters don't remove anything
+    return len(index['movies']), None
+
+def plan_filters(index, filters):
+    # Order the filters so the most selective one runs first
+    plan = []
+    for filter_type, filter_value in filters:
+        if filter_type not in ('genre', 'director', 'actor', 'length'):
+            continue
+        estimate, terms = estimate_matches(index, filter_type, filter_value)
+        plan.append((estimate, filter_type, filter_value, terms))
+    plan.sort(key=lambda step: step[0])
+    return plan
+
+def step_ids(index, filter_type, filter_value, terms):
+    # Get every movie id that matches one planned filter
+    if filter_type == 'length':
+        return set(length_ids(index, *filter_value))
+
+    postings = index[filter_type]['postings']
+    ids = set()
+    for term in terms:
+        ids.update(postings[term])
+    return ids
+
+def search_index(index, filters):
+    # Answer a list of filters from the index (AND logic)
+    movies = index['movies']
+    plan = plan_filters(index, filters)
+    if not plan:
+        return movies
+
+    # The most selective filter gives the starting set of ids
+    estimate, filter_type, filter_value, terms = plan[0]
+    ids = step_ids(index, filter_type, filter_value, terms)
+
+    for estimate, filter_type, filter_value, terms in plan[1:]:
+        if not ids:
+            break
+        if len(ids) <= estimate:
+            # Fewer candidates than matches, so just check each candidate
+            ids = {i for i in ids if movie_matches(movies[i], filter_type, filter_value)}
+        else:
+            ids &= step_ids(index, filter_type, filter_value, terms)
+
+    # Keep the results in the same order as the movie list
+    if isinstance(movies, MovieTable):
+        # Ids are known to be in range, so skip MovieTable's checks
+        return [MovieRow(movies, i) for i in sorted(ids)]
+    return [movies[i] for i in sorted(ids)]
+
 def filter_by_genre(movies, genre_query):
     # Filter movies by genre
     genre_query = genre_query.strip().lower()
@@ -85,6 +885,11 @@ def filter_by_actor(movies, actor_query):
 
 def filter_by_length(movies, min_length=None, max_length=None):
     # Filter movies by length
+    if movie_index.get('movies') is movies:
+        # Binary search the sorted lengths instead of checking every movie
+        ids = sorted(length_ids(movie_index, min_length, max_length))
+        return [movies[i] for i in ids]
+
     results = []
     
     for movie in movies:
@@ -107,10 +912,84 @@ def filter_by_length(movies, min_length=None, max_length=None):
     
     return results
 
+def configure_cache(size=128, policy='lru'):
+    # Change how many searches are cached and which one gets dropped when full
+    if policy not in ('lru', 'fifo'):
+        raise ValueError("policy must be 'lru' or 'fifo'")
+    with cache_lock:
+        result_cache['size'] = size
+        result_cache['policy'] = policy
+        clear_cache()
+
+def clear_cache():
+    # Forget every cached search (the catalog changed)
+    with cache_lock:
+        result_cache['entries'] = OrderedDict()
+        result_cache['index'] = None
+
+def cache_stats():
+    # Hit/miss counters for the search cache
+    lookups = result_cache['hits'] + result_cache['misses']
+    return {
+        'entries': len(result_cache['entries']),
+        'size': result_cache['size'],
+        'policy': result_cache['policy'],
+        'hits': result_cache['hits'],
+        'misses': result_cache['misses'],
+        'evictions': result_cache['evictions'],
+        'hit_rate': result_cache['hits'] / lookups if lookups else 0.0,
+    }
+
+def cache_key(filters):
+    # Clean up filters so the same search always gives the same key
+    # The filters are ANDed, so their order and repeats don't matter
+    key = set()
+    for filter_type, filter_value in filters:
+        if filter_type == 'length':
+            key.add((filter_type, tuple(filter_value)))
+        elif isinstance(filter_value, str):
+            key.add((filter_type, filter_value.strip().lower()))
+        else:
+            key.add((filter_type, repr(filter_value)))
+    return tuple(sorted(key, key=repr))
+
+def cached_search(index, filters):
+    # search_index, but repeated searches come straight from the cache
+    key = cache_key(filters)
+    with cache_lock:
+        if result_cache['index'] is not index:
+            # A new catalog was loaded, so the old results are no good
+            clear_cache()
+            result_cache['index'] = index
+
+        entries = result_cache['entries']
+        results = entries.get(key)
+        if results is not None:
+            result_cache['hits'] += 1
+            if result_cache['policy'] == 'lru':
+                entries.move_to_end(key)
+            return results
+        result_cache['misses'] += 1
+
+    results = search_index(index, filters)
+    with cache_lock:
+        # Only keep it if the cache is still for this catalog
+        if result_cache['size'] > 0 and result_cache['index'] is index:
+            entries = result_cache['entries']
+            entries[key] = results
+            while len(entries) > result_cache['size']:
+                entries.popitem(last=False)
+                result_cache['evictions'] += 1
+    return results
+
 def combine_filters(movies, filters):
     # Combine multiple filters (AND logic)
     if not filters:
         return movies
+
+    # Use the index when searching the loaded movie list
+    if movie_index.get('movies') is movies:
+        return cached_search(movie_index, filters)
     
     # Start with all movies
     results = movies
@@ -129,30 +1008,336 @@ def combine_filters(movies, filters):
     
     return results
 
-def print_movies(movies, show_all=False):
-    # Print movie list
+def movie_features(movie):
+    # The features used to compare movies: genres, director, actors and a length bucket
+    features = {'genre:' + genre for genre in movie['genres'] if genre}
+    if movie['director']:
+        features.add('director:' + movie['director'].lower())
+    features.update('actor:' + actor for actor in movie['actors'] if actor)
+    if movie['length'] > 0:
+        features.add(f"length:{movie['length'] // LENGTH_BUCKET}")
+    return features
+
+def build_similarity(movies, count=SIMILAR_COUNT, precompute=None):
+    # Turn every movie into a sparse feature vector for "more like this"
+    # Rare features (an actor) count more than common ones (a genre) and
+    # vectors are normalized, so the score is the cosine similarity.
+    # With SciPy the neighbour table is worked out up front (for catalogs up
+    # to PRECOMPUTE_LIMIT movies), otherwise each movie's neighbours are
+    # worked out the first time it's viewed and then kept.
+    feature_ids = {}
+    rows = []
+    for movie in movies:
+        rows.append(sorted({feature_ids.setdefault(f, len(feature_ids)) for f in movie_features(movie)}))
+
+    postings = [[] for f in feature_ids]
+    for movie_id, columns in enumerate(rows):
+        for column in columns:
+            postings[column].append(movie_id)
+
+    total = max(len(rows), 1)
+    weights = [math.log(1 + total / len(ids)) for ids in postings]
+    norms = array('d', [math.sqrt(sum(weights[c] ** 2 for c in columns)) or 1.0 for columns in rows])
+
+    engine = {
+        'movies': movies,
+        'count': count,
+        'rows': rows,
+        'postings': postings,
+        'weights': weights,
+        'norms': norms,
+        'neighbours': {},
+        'row_ids': None,
+        'matrix': None,
+    }
+
+    if sparse is not None:
+        engine['matrix'] = build_feature_matrix(engine)
+        if precompute is None:
+            precompute = len(rows) <= PRECOMPUTE_LIMIT
+        if precompute:
+            precompute_neighbours(engine)
+    return engine
+
+def build_feature_matrix(engine):
+    # Put the normalized feature vectors into a SciPy sparse matrix (one row per movie)
+    rows = engine['rows']
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(columns) for columns in rows])
+    indices = np.fromiter((c for columns in rows for c in columns), dtype=np.int32, count=indptr[-1])
+    weights = np.asarray(engine['weights'])
+    norms = np.repeat(np.asarray(engine['norms']), np.diff(indptr))
+    return sparse.csr_matrix((weights[indices] / norms, indices, indptr),
+                             shape=(len(rows), len(engine['postings'])))
+
+def top_neighbours(scores, count):
+    # Pick the best `count` movie ids from each row of a score block
+    # (ties go to the lower id, and the movie itself was already set to -1)
+    total = scores.shape[1]
+    keep = min(count, total)
+    if keep == 0:
+        return [[] for row in scores]
+    # Partition the scores as they are (negating them would copy the whole block)
+    top = np.argpartition(scores, total - keep, axis=1)[:, total - keep:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+
+    neighbours = []
+    for row, ids, values in zip(scores, top, top_scores):
+        cutoff = values.min()
+        if cutoff > 0 and np.count_nonzero(row == cutoff) > np.count_nonzero(values == cutoff):
+            # More movies tie at the cut-off than argpartition kept, and it
+            # keeps any of them, so take the lowest ids instead
+            better = np.flatnonzero(row > cutoff)
+            ids = np.concatenate((better, np.flatnonzero(row == cutoff)[:keep - len(better)]))
+            values = row[ids]
+        order = np.lexsort((ids, -values))
+        neighbours.append([int(ids[i]) for i in order if values[i] > 0])
+    return neighbours
+
+def precompute_neighbours(engine, batch_cells=2_000_000):
+    # Work out the top neighbours of every movie with batched sparse matrix products
+    matrix = engine['matrix']
+    total = matrix.shape[0]
+    transposed = matrix.T.tocsc()
+
+    # Each batch makes a (batch x total) score block of float64, plus
+    # argpartition's int64 index block, so 2M cells is about 32 MB at once
+    batch = max(1, batch_cells // max(total, 1))
+    for start in range(0, total, batch):
+        end = min(start + batch, total)
+        scores = (matrix[start:end] @ transposed).toarray()
+        scores[np.arange(end - start), np.arange(start, end)] = -1.0  # not similar to itself
+        for offset, neighbours in enumerate(top_neighbours(scores, engine['count'])):
+            engine['neighbours'][start + offset] = neighbours
+
+def similar_movies(engine, movie_id):
+    # Get the ids of the movies most like movie_id, best match first
+    neighbours = engine['neighbours']
+    if movie_id in neighbours:
+        return neighbours[movie_id]
+
+    if engine['matrix'] is not None:
+        # One sparse row times the whole matrix
+        matrix = engine['matrix']
+        scores = (matrix[movie_id] @ matrix.T).toarray()
+        scores[0, movie_id] = -1.0
+        neighbours[movie_id] = top_neighbours(scores, engine['count'])[0]
+        return neighbours[movie_id]
+
+    # Add up the shared feature weights with every movie that has any feature in common
+    postings = engine['postings']
+    weights = engine['weights']
+    norms = engine['norms']
+    scores = {}
+    for column in engine['rows'][movie_id]:
+        weight = weights[column] ** 2
+        for other in postings[column]:
+            scores[other] = scores.get(other, 0.0) + weight
+    scores.pop(movie_id, None)
+
+    best = nsmallest(engine['count'], scores.items(), key=lambda item: (-item[1] / norms[item[0]], item[0]))
+    neighbours[movie_id] = [other for other, score in best]
+    return neighbours[movie_id]
+
+def find_movie_id(lookup, movie):
+    # Find where a movie is in the catalog of an index or similarity engine
+    if isinstance(movie, MovieRow):
+        return movie.movie_id
+    if lookup.get('row_ids') is None:
+        lookup['row_ids'] = {id(m): i for i, m in enumerate(lookup['movies'])}
+    return lookup['row_ids'].get(id(movie))
+
+def show_similar(movie):
+    # Print a short "more like this" list for the movie being viewed
+    global similarity_engine
+    if similarity_movies is None:
+        return
+    if similarity_engine is None or similarity_engine['movies'] is not similarity_movies:
+        similarity_engine = build_similarity(similarity_movies)
+    movie_id = find_movie_id(similarity_engine, movie)
+    if movie_id is None:
+        return
+
+    movies = similarity_engine['movies']
+    similar = similar_movies(similarity_engine, movie_id)
+    if similar:
+        print("More like this:")
+        for other in similar:
+            print(f"   - {movies[other]['title']} ({movies[other]['director']})")
+        print("=" * 40)
+
+# ============================================
+# QUERY API (no input() prompts, used by batch mode)
+# ============================================
+
+# Keys a query spec can have
+SPEC_KEYS = ('id', 'genre', 'director', 'actor', 'min_length', 'max_length', 'limit', 'offset')
+
+def spec_to_filters(spec):
+    # Turn a query spec like {"genre": "comedy", "min_length": 90} into the
+    # filter list combine_filters uses. genre/director/actor can also be a
+    # list, and then every value has to match.
+    # Raises ValueError if the spec doesn't make sense.
+    if not isinstance(spec, dict):
+        raise ValueError("query must be a JSON object")
+    unknown = [key for key in spec if key not in SPEC_KEYS]
+    if unknown:
+        raise ValueError(f"unknown keys: {', '.join(unknown)}")
+
+    filters = []
+    for filter_type in ('genre', 'director', 'actor'):
+        values = spec.get(filter_type)
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        elif not isinstance(values, list):
+            raise ValueError(f"{filter_type} must be a string or a list of strings")
+        for value in values:
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"{filter_type} must be a non-empty string")
+            filters.append((filter_type, value))
+
+    min_length = spec.get('min_length')
+    max_length = spec.get('max_length')
+    for name, value in (('min_length', min_length), ('max_length', max_length)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            raise ValueError(f"{name} must be a whole number")
+    if min_length is not None or max_length is not None:
+        filters.append(('length', (min_length, max_length)))
+    return filters
+
+def movie_to_dict(movie, movie_id=None):
+    # Make a JSON friendly copy of a movie
+    result = {}
+    if movie_id is not None:
+        result['id'] = movie_id
+    result['title'] = movie['title']
+    result['director'] = movie['director']
+    result['genres'] = list(movie['genres'])
+    result['rating'] = movie['rating']
+    result['length'] = movie['length']
+    result['actors'] = list(movie['actors'])
+    return result
+
+def query_movies(movies, spec, index=None):
+    # Run one query spec against the loaded catalog
+    # Returns {"count": total matches, "results": [one page of movies]}
+    # index is the catalog's search index (defaults to the one load_movies made)
+    filters = spec_to_filters(spec)
+    limit = spec.get('limit', PAGE_SIZE)
+    offset = spec.get('offset', 0)
+    for value in (limit, offset):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError("limit and offset must be whole numbers >= 0")
+
+    if index is None and movie_index.get('movies') is movies:
+        index = movie_index
+    if index is None:
+        # No index for this list, so search it the slow way
+        results = combine_filters(movies, filters)
+        index = {'movies': movies}
+    elif filters:
+        results = cached_search(index, filters)
+    else:
+        results = movies
+
+    page = []
+    for i in range(offset, min(offset + limit, len(results))):
+        movie = results[i]
+        page.append(movie_to_dict(movie, find_movie_id(index, movie)))
+
+    answer = {}
+    if 'id' in spec:
+        answer['id'] = spec['id']
+    answer['count'] = len(results)
+    answer['results'] = page
+    return answer
+
+def run_batch(movies, in_file, out_file):
+    # Read one JSON query spec per line and write one JSON answer per line
+    # Bad lines get an {"error": ...} answer instead of stopping the batch
+    # Returns (number of queries, seconds taken)
+    count = 0
+    start = time.perf_counter()
+    for line_num, line in enumerate(in_file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        count += 1
+        spec = None
+        try:
+            spec = json.loads(line)
+            answer = query_movies(movies, spec)
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too
+            answer = {}
+            if isinstance(spec, dict) and 'id' in spec:
+                answer['id'] = spec['id']
+            answer['line'] = line_num
+            answer['error'] = str(e)
+        out_file.write(json.dumps(answer) + '\n')
+    out_file.flush()
+    return count, time.perf_counter() - start
+
+def page_count(movies, page_size=PAGE_SIZE):
+    # How many pages a list of movies takes up
+    return max(1, (len(movies) + page_size - 1) // page_size)
+
+def print_movies(movies, show_all=False, page=1, page_size=PAGE_SIZE):
+    # Print one page of a movie list
+    # Only the movies on that page get formatted, and the whole page is
+    # written in one go. Returns the page that was shown.
     if not movies:
         print("No movies found.")
-        return
-    
+        return 1
+
+    pages = page_count(movies, page_size)
+    page = min(max(page, 1), pages)
+    start = (page - 1) * page_size
+    end = min(start + page_size, len(movies))
+
+    lines = []
     if show_all:
-        print(f"\n=== FULL MOVIE LIST ({len(movies)} movies) ===")
+        lines.append(f"\n=== FULL MOVIE LIST ({len(movies)} movies) ===")
     else:
-        print(f"\n=== SEARCH RESULTS ({len(movies)} movies) ===")
+        lines.append(f"\n=== SEARCH RESULTS ({len(movies)} movies) ===")
+    if pages > 1:
+        lines.append(f"Page {page} of {pages} (movies {start + 1}-{end})")
     
-    for i, movie in enumerate(movies, 1):
+    for i in range(start, end):
+        movie = movies[i]
+
         # Format genres for display
         genres = ', '.join([g.title() for g in movie['genres']])
         
         # Format actors for display
         actors = ', '.join([a.title() for a in movie['actors'][:3]])  # Show first 3 actors
         
-        print(f"{i}. {movie['title']}")
-        print(f"   Genres: {genres}")
-        print(f"   Director: {movie['director']}")
-        print(f"   Rating: {movie['rating']} | Length: {movie['length']} min")
-        print(f"   Actors: {actors}")
-        print()
+        lines.append(f"{i + 1}. {movie['title']}")
+        lines.append(f"   Genres: {genres}")
+        lines.append(f"   Director: {movie['director']}")
+        lines.append(f"   Rating: {movie['rating']} | Length: {movie['length']} min")
+        lines.append(f"   Actors: {actors}")
+        lines.append("")
+
+    if pages > 1:
+        lines.append("'n' = next page, 'p' = previous page, 'page 5' = jump to a page")
+    sys.stdout.write('\n'.join(lines) + '\n')
+    return page
+
+def page_command(action, page, pages):
+    # Work out the new page for 'n'/'next', 'p'/'prev' or 'page 5'/'jump 5'
+    # Returns None if the action isn't a page command
+    if action in ('n', 'next'):
+        return min(page + 1, pages)
+    if action in ('p', 'prev', 'previous'):
+        return max(page - 1, 1)
+
+    parts = action.split()
+    if len(parts) == 2 and parts[0] in ('page', 'jump', 'j') and parts[1].isdigit():
+        return min(max(int(parts[1]), 1), pages)
+    return None
 
 def get_user_filters():
     # Get filter choices from user
@@ -244,6 +1429,7 @@ def show_movie_details(movie):
     actors = ', '.join([a.title() for a in movie['actors']])
     print(f"Notable Actors: {actors}")
     print("=" * 40)
+    show_similar(movie)
 
 def search_movies(movies):
     # Handle the search flow
@@ -272,7 +1458,8 @@ def search_movies(movies):
             continue
         
         # Show results
-        print_movies(results)
+        page = print_movies(results)
+        pages = page_count(results)
         
         # Option to see detals
         print("Enter a movie number to see details,")
@@ -281,11 +1468,14 @@ def search_movies(movies):
         
         while True:
             action = input("\nYour choice: ").strip().lower()
+            new_page = page_command(action, page, pages)
             
             if action == 'menu':
                 return
             elif action == 'search':
                 break  #go back to search screen
+            elif new_page is not None:
+                page = print_movies(results, page=new_page)
             else:
                 try:
                     movie_num = int(action)
@@ -299,15 +1489,16 @@ def search_movies(movies):
                         if sub_action == 'menu':
                             return
                         # Otherwise just show the results again
-                        print_movies(results)
+                        print_movies(results, page=page)
                         print("Enter a movie number, 'search', or 'menu':")
                     else:
                         print(f"Please enter a number between 1 and {len(results)}")
                 except:
                     print("Please enter a valid movie number, 'search', or 'menu'")
 
-def main():
+def main(filename="movies.csv", workers=1):
     # Main function that runs the progran
+    global similarity_engine, similarity_movies
     print("=" * 50)
     print("MOVIE RECOMMENDER SYSTEM")
     print("=" * 50)
@@ -316,11 +1507,15 @@ def main():
     print()
     
     # Load movies
-    movies = load_movies("movies.csv")
+    movies = load_catalog(filename, workers)
     
     if not movies:
         print("Cannot run without movie data. Exiting.")
         return
+
+    # "More like this" on the details screen is worked out when first needed
+    similarity_engine = None
+    similarity_movies = movies
     
     # Main menu loop
     while True:
@@ -336,7 +1531,8 @@ def main():
             search_movies(movies)
         
         elif choice == '2':
-            print_movies(movies, show_all=True)
+            page = print_movies(movies, show_all=True)
+            pages = page_count(movies)
             
             # Ask if they want to see details
             print("Enter a movie number to see details,")
@@ -344,9 +1540,12 @@ def main():
             
             while True:
                 action = input("\nYour choice: ").strip().lower()
+                new_page = page_command(action, page, pages)
                 
                 if action == 'menu':
                     break
+                elif new_page is not None:
+                    page = print_movies(movies, show_all=True, page=new_page)
                 else:
                     try:
                         movie_num = int(action)
@@ -364,6 +1563,43 @@ def main():
         
         else:
             print("Please enter 1, 2, or 3")
+def run_cli(argv=None):
+    # Start the program: interactive menu by default, or batch mode
+    parser = argparse.ArgumentParser(description="Movie recommender")
+    parser.add_argument('--csv', default='movies.csv', help="movie CSV file (default movies.csv)")
+    parser.add_argument('--batch', metavar='QUERIES', help="JSONL file of query specs ('-' for stdin)")
+    parser.add_argument('--output', metavar='RESULTS', default='-', help="where to write JSONL results (default stdout)")
+    parser.add_argument('--workers', type=int, default=1, help="processes to use when parsing the CSV")
+    args = parser.parse_args(argv)
+
+    if not args.batch:
+        main(args.csv, args.workers)
+        return
+
+    # Status messages go to stderr so stdout is only JSON results
+    real_stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        movies = load_catalog(args.csv, args.workers)
+    finally:
+        sys.stdout = real_stdout
+    if not movies:
+        sys.exit(1)
+
+    in_file = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+    out_file = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        count, seconds = run_batch(movies, in_file, out_file)
+    finally:
+        if in_file is not sys.stdin:
+            in_file.close()
+        if out_file is not sys.stdout:
+            out_file.close()
+
+    rate = count / seconds if seconds > 0 else 0
+    print(f"Answered {count} queries in {seconds:.3f}s ({rate:.0f} queries/sec)", file=sys.stderr)
+
 # Restart/ Start the program again            
-main()
+if __name__ == "__main__":
+    run_cli()
 
@@ -0,0 +1,293 @@
+# DU Larose P1
+# Benchmarks for the movie recommender (dddd.py)
+# Run: python dddd_bench.py generate movies_100k.csv --rows 100000
+#      python dddd_bench.py suite --rows 10000 100000 1000000 --output results.json
+#      python dddd_bench.py suite --rows 10000 --compare results.json
+#      python dddd_bench.py memory movies.csv
+#      python dddd_bench.py scaling movies.csv --workers 8
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import dddd
+
+# Pools the synthetic catalog draws from
+GENRES = ['Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime',
+          'Documentary', 'Drama', 'Family', 'Fantasy', 'History', 'Horror',
+          'Music', 'Musical', 'Mystery', 'Romance', 'Science Fiction', 'Sport',
+          'Thriller', 'War', 'Western']
+RATINGS = ['G', 'PG', 'PG-13', 'R', 'NC-17', 'Not Rated']
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael',
+               'Linda', 'David', 'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan',
+               'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Song', 'Ana', 'Keanu', 'Zoe']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+              'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
+              'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Kang-ho', 'de Armas', 'Reeves', 'Stone', 'Hanks']
+TITLE_WORDS = ['Night', 'Return', 'Last', 'City', 'Dark', 'Love', 'Star', 'War',
+               'Lost', 'Secret', 'Dream', 'Fire', 'Road', 'House', 'King', 'Storm',
+               'River', 'Ghost', 'Summer', 'Winter', 'Empire', 'Shadow', 'Heart']
+
+# Queries timed by the suite: name -> filters (names must stay the same between
+# versions so results can be compared)
+SINGLE_QUERIES = {
+    'genre_common': [('genre', 'drama')],
+    'genre_substring': [('genre', 'fic')],
+    'director': [('director', 'garcia')],
+    'actor_rare': [('actor', 'zoe lee')],
+    'length_range': [('length', (90, 120))],
+    'length_open': [('length', (150, None))],
+}
+COMPOUND_QUERIES = {
+    'genre_length': [('genre', 'comedy'), ('length', (80, 100))],
+    'genre_actor_length': [('genre', 'drama'), ('actor', 'smith'), ('length', (None, 110))],
+    'director_genre_actor': [('director', 'james'), ('genre', 'thriller'), ('actor', 'reeves')],
+}
+
+# A query is a regression if it got this much slower than the saved results
+# (and by more than REGRESSION_FLOOR seconds, so tiny timings don't flag on noise)
+REGRESSION_RATIO = 1.25
+REGRESSION_FLOOR = 0.001
+
+def zipf_weights(count, exponent=1.1):
+    # Cumulative Zipf weights: item k is picked about 1/k^exponent as often
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+def make_names(count, rng):
+    # Make `count` different person names
+    names = set()
+    while len(names) < count:
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        if name in names:
+            name += f" {len(names)}"
+        names.add(name)
+    names = sorted(names)
+    rng.shuffle(names)
+    return names
+
+def generate_catalog(filename, rows, seed=42):
+    # Write a synthetic movies.csv with Zipf-distributed genres, directors and actors
+    rng = random.Random(seed)
+    directors = make_names(max(10, rows // 20), rng)
+    actors = make_names(max(50, rows // 2), rng)
+    genre_weights = zipf_weights(len(GENRES))
+    director_weights = zipf_weights(len(directors))
+    actor_weights = zipf_weights(len(actors))
+
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Title', 'Director', 'Genre', 'Rating', 'Length (min)', 'Notable Actors'])
+        for i in range(rows):
+            title = ' '.join(rng.choices(TITLE_WORDS, k=rng.randint(1, 3))) + f" {i}"
+            director = rng.choices(directors, cum_weights=director_weights)[0]
+            genres = dict.fromkeys(rng.choices(GENRES, cum_weights=genre_weights, k=rng.randint(1, 3)))
+            cast = dict.fromkeys(rng.choices(actors, cum_weights=actor_weights, k=rng.randint(2, 5)))
+            # About 5% of movies have an unknown length
+            length = 0 if rng.random() < 0.05 else max(60, int(rng.gauss(105, 20)))
+            writer.writerow([title, director, '/'.join(genres), rng.choice(RATINGS), length, ', '.join(cast)])
+
+def time_query(movies, filters, repeat):
+    # Median time of one search (the result cache is off while timing)
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        dddd.combine_filters(movies, filters)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+def peak_rss_kb():
+    # Most memory this process has used so far (Linux reports KB, macOS bytes)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def run_one(filename, repeat):
+    # Time load and queries for one catalog file (runs in its own process
+    # so the peak memory belongs to this catalog only)
+    dddd.configure_cache(size=0)
+
+    start = time.perf_counter()
+    movies = dddd.load_movies(filename, compact=True)
+    load_seconds = time.perf_counter() - start
+
+    result = {
+        'rows': len(movies),
+        'load_seconds': load_seconds,
+        'single': {name: time_query(movies, filters, repeat) for name, filters in SINGLE_QUERIES.items()},
+        'compound': {name: time_query(movies, filters, repeat) for name, filters in COMPOUND_QUERIES.items()},
+        'matches': {name: len(dddd.combine_filters(movies, filters))
+                    for name, filters in {**SINGLE_QUERIES, **COMPOUND_QUERIES}.items()},
+    }
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+def run_suite(sizes, data_dir, repeat):
+    # Generate (or reuse) a catalog for every size and benchmark each one
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+    for rows in sizes:
+        filename = os.path.join(data_dir, f"movies_{rows}.csv")
+        if not os.path.exists(filename):
+            print(f"Generating {rows} movies...", file=sys.stderr)
+            generate_catalog(filename, rows)
+
+        print(f"Benchmarking {rows} movies...", file=sys.stderr)
+        output = subprocess.run(
+            [sys.executable, __file__, 'run-one', filename, '--repeat', str(repeat)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+def git_version():
+    # Current commit, so saved results say which version they came from
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+def print_suite(results):
+    for result in results:
+        print(f"\n{result['rows']} movies: load {result['load_seconds']:.3f}s, "
+              f"peak RSS {result['peak_rss_kb'] / 1024:.1f} MB")
+        for group in ('single', 'compound'):
+            for name, seconds in result[group].items():
+                print(f"   {name:<22} {seconds * 1000:>10.3f} ms  ({result['matches'][name]} matches)")
+
+def compare_results(old, new):
+    # Print the change against saved results and return the regressions found
+    old_by_rows = {result['rows']: result for result in old['results']}
+    regressions = []
+    for result in new['results']:
+        before = old_by_rows.get(result['rows'])
+        if before is None:
+            continue
+        timings = [('load', before['load_seconds'], result['load_seconds'])]
+        for group in ('single', 'compound'):
+            for name, seconds in result[group].items():
+                if name in before[group]:
+                    timings.append((name, before[group][name], seconds))
+
+        print(f"\n{result['rows']} movies vs {old.get('version') or 'saved results'}:")
+        for name, old_seconds, new_seconds in timings:
+            ratio = new_seconds / old_seconds if old_seconds > 0 else 1.0
+            slower = ratio > REGRESSION_RATIO and new_seconds - old_seconds > REGRESSION_FLOOR
+            flag = '  <-- slower' if slower else ''
+            print(f"   {name:<22} {ratio:>6.2f}x{flag}")
+            if flag:
+                regressions.append((result['rows'], name, ratio))
+    return regressions
+
+def measure(build):
+    # Return how many bytes the object made by build() is using
+    tracemalloc.start()
+    result = build()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used, result
+
+def memory_benchmark(filename):
+    # Compare the list of dicts layout with the MovieTable layout
+    dict_bytes, movies = measure(lambda: list(dddd.read_movies(filename)))
+    table_bytes, table = measure(lambda: dddd.MovieTable.from_movies(dddd.read_movies(filename)))
+
+    count = len(movies)
+    saved = dict_bytes - table_bytes
+    print(f"Movies:            {count}")
+    print(f"List of dicts:     {dict_bytes / 1024 / 1024:.2f} MB ({dict_bytes / max(count, 1):.0f} bytes/movie)")
+    print(f"MovieTable:        {table_bytes / 1024 / 1024:.2f} MB ({table_bytes / max(count, 1):.0f} bytes/movie)")
+    print(f"Saved:             {saved / 1024 / 1024:.2f} MB ({saved / max(dict_bytes, 1):.0%})")
+    return {'movies': count, 'dict_bytes': dict_bytes, 'table_bytes': table_bytes}
+
+def scaling_benchmark(filename, max_workers):
+    # Time the CSV load with 1, 2, 4, ... up to max_workers processes
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+
+    results = []
+    base_time = None
+    print(f"{'Workers':>8} {'Seconds':>10} {'Speedup':>8}")
+    for workers in counts:
+        start = time.perf_counter()
+        movies = dddd.load_movies(filename, compact=True, workers=workers)
+        seconds = time.perf_counter() - start
+        if base_time is None:
+            base_time = seconds
+        print(f"{workers:>8} {seconds:>10.3f} {base_time / seconds:>7.2f}x")
+        results.append({'workers': workers, 'movies': len(movies), 'seconds': seconds})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for dddd.py")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="write a synthetic movies CSV")
+    generate.add_argument('csv_file')
+    generate.add_argument('--rows', type=int, default=10000)
+    generate.add_argument('--seed', type=int, default=42)
+
+    suite = commands.add_parser('suite', help="time load and queries for several catalog sizes")
+    suite.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    suite.add_argument('--data-dir', default='bench_data', help="where generated catalogs are kept")
+    suite.add_argument('--repeat', type=int, default=5, help="times to run each query")
+    suite.add_argument('--output', help="save results as JSON")
+    suite.add_argument('--compare', help="JSON results from an earlier run to compare against")
+
+    run_one_parser = commands.add_parser('run-one', help=argparse.SUPPRESS)
+    run_one_parser.add_argument('csv_file')
+    run_one_parser.add_argument('--repeat', type=int, default=5)
+
+    memory = commands.add_parser('memory', help="memory of dicts vs MovieTable")
+    memory.add_argument('csv_file')
+
+    scaling = commands.add_parser('scaling', help="parallel load speed for 1..N workers")
+    scaling.add_argument('csv_file')
+    scaling.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                         help="most worker processes to try")
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate_catalog(args.csv_file, args.rows, args.seed)
+    elif args.command == 'run-one':
+        # load_movies prints status lines, so the JSON goes on the last line
+        print(json.dumps(run_one(args.csv_file, args.repeat)))
+    elif args.command == 'suite':
+        report = {
+            'version': git_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': run_suite(args.rows, args.data_dir, args.repeat),
+        }
+        print_suite(report['results'])
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as file:
+                regressions = compare_results(json.load(file), report)
+            if regressions:
+                print(f"\n{len(regressions)} regression(s) found")
+                sys.exit(1)
+    elif args.command == 'memory':
+        memory_benchmark(args.csv_file)
+    else:
+        scaling_benchmark(args.csv_file, args.workers)
+
+if __name__ == "__main__":
+    main()
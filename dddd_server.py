@@ -0,0 +1,228 @@
+# DU Larose P1
+# Local HTTP query server for the movie recommender (dddd.py)
+# Run: python dddd_server.py --csv movies.csv --port 8000
+#
+# GET /search?genre=comedy&min_length=90&limit=5   same filters as combine_filters
+# GET /movies/12                                    details (and similar movies) by id
+# GET /stats                                        catalog size and cache counters
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import dddd
+
+# Biggest request header block we accept
+MAX_HEADER_BYTES = 16 * 1024
+# Biggest request body we will read past (we only answer GET)
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+class QueryError(Exception):
+    # A request we can't answer, with the HTTP status to send back
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def load_server_catalog(filename, workers=1):
+    # Load the catalog and everything the server needs for it
+    # (runs in a worker thread so a reload never blocks the event loop)
+    signature = dddd.csv_signature(filename)
+    movies = dddd.load_catalog(filename, workers)
+    if not movies:
+        raise ValueError(f"no movies loaded from {filename}")
+
+    # Only the reload thread loads catalogs, so the index load_catalog just
+    # made is still the one in dddd.movie_index
+    index = dddd.movie_index
+    return {
+        'movies': movies,
+        'index': index,
+        'engine': dddd.build_similarity(movies, precompute=False),
+        'signature': signature,
+        'loaded_at': time.time(),
+    }
+
+def query_string_spec(query):
+    # Turn a query string into a query spec for dddd.query_movies
+    params = parse_qs(query, keep_blank_values=False)
+    spec = {}
+    for key, values in params.items():
+        if key in ('genre', 'director', 'actor'):
+            spec[key] = values
+        elif key in ('min_length', 'max_length', 'limit', 'offset'):
+            try:
+                spec[key] = int(values[-1])
+            except ValueError:
+                raise QueryError(400, f"{key} must be a whole number")
+        else:
+            raise QueryError(400, f"unknown parameter: {key}")
+    return spec
+
+class MovieServer:
+    # Answers HTTP queries from one loaded catalog and swaps in a new
+    # catalog when the CSV file changes
+
+    def __init__(self, filename, workers=1, poll_interval=2.0):
+        self.filename = filename
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.catalog = None
+        self.reloads = 0
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        self.catalog = await loop.run_in_executor(None, load_server_catalog, self.filename, self.workers)
+
+    async def watch_file(self):
+        # Check the CSV every poll_interval seconds and reload it when it changes
+        # Queries keep using the old catalog until the new one is ready
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                signature = dddd.csv_signature(self.filename)
+            except OSError:
+                continue
+            if signature == self.catalog['signature']:
+                continue
+
+            print(f"{self.filename} changed, reloading...")
+            try:
+                catalog = await loop.run_in_executor(None, load_server_catalog, self.filename, self.workers)
+            except Exception as e:
+                print(f"Reload failed, still serving the old catalog: {e}")
+                # Don't retry until the file changes again
+                self.catalog['signature'] = signature
+                continue
+            self.catalog = catalog
+            self.reloads += 1
+
+    async def answer(self, method, target):
+        # Work out the (status, JSON body) for one request
+        if method != 'GET':
+            raise QueryError(405, "only GET is supported")
+
+        # Every part of this request uses the same catalog even if a reload finishes
+        catalog = self.catalog
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['search']:
+            spec = query_string_spec(url.query)
+            # A broad search on a big catalog takes a while, so keep it off
+            # the event loop and let other connections be answered meanwhile
+            loop = asyncio.get_running_loop()
+            try:
+                answer = await loop.run_in_executor(None, dddd.query_movies, catalog['movies'], spec, catalog['index'])
+            except ValueError as e:
+                raise QueryError(400, str(e))
+            return 200, answer
+
+        if len(parts) == 2 and parts[0] == 'movies':
+            movies = catalog['movies']
+            # isdigit() alone also takes digits like '²' that int() refuses
+            if not (parts[1].isascii() and parts[1].isdigit()) or int(parts[1]) >= len(movies):
+                raise QueryError(404, "no movie with that id")
+            movie_id = int(parts[1])
+            # Similar movies can take a moment to work out, so do it off the event loop
+            loop = asyncio.get_running_loop()
+            similar = await loop.run_in_executor(None, dddd.similar_movies, catalog['engine'], movie_id)
+            details = dddd.movie_to_dict(movies[movie_id], movie_id)
+            details['similar'] = [dddd.movie_to_dict(movies[other], other) for other in similar]
+            return 200, details
+
+        if parts == ['stats']:
+            return 200, {
+                'movies': len(catalog['movies']),
+                'loaded_at': catalog['loaded_at'],
+                'reloads': self.reloads,
+                'cache': dddd.cache_stats(),
+            }
+
+        raise QueryError(404, "unknown path")
+
+    async def handle_client(self, reader, writer):
+        # Answer requests on one connection until the client closes it
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                request = lines[0].split()
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and request[-1:] == ['HTTP/1.1']
+
+                # Skip any request body (we only answer GET). If we can't
+                # tell where the body ends we can't find the next request
+                # either, so answer and close the connection.
+                length = headers.get('content-length', '0') or '0'
+                if not (length.isascii() and length.isdigit()) or int(length) > MAX_BODY_BYTES:
+                    status, body = 400, {'error': "bad Content-Length"}
+                    keep_alive = False
+                else:
+                    try:
+                        await reader.readexactly(int(length))
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+
+                    if len(request) != 3:
+                        status, body = 400, {'error': "bad request line"}
+                    else:
+                        try:
+                            status, body = await self.answer(request[0], request[1])
+                        except QueryError as e:
+                            status, body = e.status, {'error': str(e)}
+
+                data = json.dumps(body).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        await self.load()
+        server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_HEADER_BYTES)
+        watcher = asyncio.create_task(self.watch_file())
+        print(f"Serving {len(self.catalog['movies'])} movies on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP query server for the movie recommender")
+    parser.add_argument('--csv', default='movies.csv', help="movie CSV file (default movies.csv)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1, help="processes to use when parsing the CSV")
+    parser.add_argument('--poll', type=float, default=2.0, help="seconds between checks for a changed CSV")
+    args = parser.parse_args()
+
+    server = MovieServer(args.csv, args.workers, args.poll)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+if __name__ == "__main__":
+    main()
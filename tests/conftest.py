@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The scripts aren't installed as packages, so import them from the tree
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in (ROOT, os.path.join(ROOT, 'bigcoolcode.py')):
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
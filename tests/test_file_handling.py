@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+import file_handling
+
+
+@pytest.fixture
+def document(tmp_path, monkeypatch):
+    # Small chunks so a short document is already several of them
+    monkeypatch.setattr(file_handling, 'CHUNK_SIZE', 64)
+    return str(tmp_path / 'notes.txt')
+
+
+def read_bytes(filename):
+    with open(filename, 'rb') as file:
+        return file.read()
+
+
+def write_bytes(filename, data):
+    with open(filename, 'wb') as file:
+        file.write(data)
+
+
+def check_count(filename, expected):
+    # The cached count and a count from scratch agree
+    assert file_handling.count_file_words(filename) == expected
+    assert file_handling.count_words(file_handling.read_file(filename)) == expected
+
+
+def count_chunk_calls(monkeypatch):
+    calls = []
+    real_count_chunk = file_handling.count_chunk
+    monkeypatch.setattr(file_handling, 'count_chunk', lambda data: calls.append(data) or real_count_chunk(data))
+    return calls
+
+
+def test_count_matches_count_words(document):
+    lines = [f"line {n} with six words here" for n in range(30)]
+    write_bytes(document, "\r\n".join(lines + ["", "Word Count: 180", "Last Updated: then"]).encode())
+    check_count(document, 180)
+    assert file_handling.count_file_words(str(document) + ".missing") == 0
+
+
+def test_unchanged_file_uses_the_cache(document, monkeypatch):
+    write_bytes(document, b"one two three\n" * 50)
+    assert file_handling.count_file_words(document) == 150
+    calls = count_chunk_calls(monkeypatch)
+    assert file_handling.count_file_words(document) == 150
+    assert calls == []
+
+
+def test_only_changed_chunks_are_counted_again(document, monkeypatch):
+    data = b"one two three\n" * 50
+    write_bytes(document, data)
+    file_handling.count_file_words(document)
+
+    calls = count_chunk_calls(monkeypatch)
+    write_bytes(document, data + b"four five\n")
+    check_count(document, 152)
+    assert len(calls) == 1
+
+
+def test_edit_in_the_middle_is_counted_again(document):
+    data = b"".join(b"line %d with six words here\n" % n for n in range(10))
+    write_bytes(document, data)
+    check_count(document, 60)
+
+    write_bytes(document, data.replace(b"line 3 with six", b"line 3 with seven extra", 1))
+    check_count(document, 61)
+
+    # Counting without the cache gives the same answer
+    os.remove(document + file_handling.CACHE_SUFFIX)
+    check_count(document, 61)
+
+
+def test_cache_from_another_chunk_size_is_ignored(document, monkeypatch):
+    write_bytes(document, b"one two three\n" * 50)
+    file_handling.count_file_words(document)
+    monkeypatch.setattr(file_handling, 'CHUNK_SIZE', 128)
+    assert file_handling.load_word_cache(document) is None
+    check_count(document, 150)
+
+
+def test_appends_replace_the_old_ending(document):
+    total = 0
+    for n in range(20):
+        line = f"entry {n} has a few more words in it"
+        total += len(line.split())
+        assert file_handling.append_to_file(document, line, f"time {n}") == total
+        check_count(document, total)
+        assert f"Word Count: {total}\n".encode() in read_bytes(document)
+
+    data = read_bytes(document)
+    assert data.count(b"Word Count:") == 1
+    assert data.endswith(b"Word Count: %d\nLast Updated: time 19" % total)
+    assert file_handling.clean_content(data.decode()).splitlines()[0] == "entry 0 has a few more words in it"
+
+
+def test_append_never_rewrites_what_was_there(document):
+    body = b"".join(b"line %d with six words here\n" % n for n in range(10))
+    write_bytes(document, body + b"\nWord Count: 60\nLast Updated: then")
+    file_handling.append_to_file(document, "more words", "now")
+    assert read_bytes(document) == body + b"more words\n\nWord Count: 62\nLast Updated: now"
+
+
+def test_only_the_ending_is_cut_off(document):
+    body = b"first line\r\nsecond line\n\nnot a Word Count: line\n"
+    write_bytes(document, body + b"\n\nWord Count: 99\r\nLast Updated: then\n\n\n")
+
+    file_handling.update_file_info(document, 9, "now")
+    assert read_bytes(document) == body + b"\nWord Count: 9\nLast Updated: now"
+    check_count(document, 9)
+
+
+def test_long_ending_is_found_past_the_first_read(document):
+    old_ending = "\nWord Count: 3\nLast Updated: then\n" * 500
+    write_bytes(document, ("one two three\n" + old_ending).encode())
+
+    assert file_handling.append_to_file(document, "four", "now") == 4
+    assert read_bytes(document) == b"one two three\nfour\n\nWord Count: 4\nLast Updated: now"
+
+
+def test_append_to_a_new_file(document):
+    assert file_handling.append_to_file(document, "hello there", "now") == 2
+    assert read_bytes(document) == b"hello there\n\nWord Count: 2\nLast Updated: now"
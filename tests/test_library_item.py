@@ -0,0 +1,43 @@
+import pytest
+
+from library_item import NO_RATING, NO_YEAR, Item, parse_rating, parse_year
+
+
+@pytest.mark.parametrize('value, year', [
+    ('1999', 1999), (' 1999 ', 1999), (1999, 1999), ('', NO_YEAR), (None, NO_YEAR),
+    ('c. 1850', None), ('19.5', None), (True, None), (False, None),
+])
+def test_parse_year(value, year):
+    assert parse_year(value) == year
+
+
+@pytest.mark.parametrize('value, rating', [
+    ('4', 4.0), ('4.5', 4.5), ('', NO_RATING), ('0', NO_RATING),
+    ('6', None), ('great', None), ('nan', None),
+])
+def test_parse_rating(value, rating):
+    assert parse_rating(value) == rating
+
+
+def test_row_round_trip():
+    row = {'id': 7, 'title': 'Dune', 'creator': 'Frank Herbert', 'year': 1965,
+           'genre': 'Science Fiction', 'format': 'Book', 'rating': '4.5', 'notes': 'Signed'}
+    item = Item.from_row(row)
+    assert item.year == 1965 and item.rating == 4.5
+    assert item.to_row() == row
+    assert Item.from_row({'title': 'Blank'}).to_row()['year'] == ''
+
+
+def test_unreadable_values_are_kept_as_written():
+    item = Item.from_row({'title': 'Old Map', 'year': 'c. 1850', 'rating': 'great'})
+    assert item.year == NO_YEAR and item.rating == NO_RATING
+    assert item.display('year') == 'c. 1850'
+    assert item.to_row()['year'] == 'c. 1850'
+    assert item.to_row()['rating'] == 'great'
+
+    # A readable value replaces the kept text
+    item.update({'year': '1851'})
+    assert item.to_row()['year'] == 1851
+    assert item.unparsed == {'rating': 'great'}
+    item.update({'rating': ''})
+    assert item.unparsed is None
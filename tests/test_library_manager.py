@@ -0,0 +1,177 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+import library_item
+
+MANAGER_PATH = os.path.join(os.path.dirname(library_item.__file__), 'library_manager.py')
+
+
+@pytest.fixture
+def open_session(tmp_path, monkeypatch):
+    # Each session is its own copy of library_manager (its own library,
+    # journal reader and lock), all working on one library in tmp_path
+    monkeypatch.chdir(tmp_path)
+    sessions = []
+
+    def open_session():
+        spec = importlib.util.spec_from_file_location(f'library_manager_{len(sessions)}', MANAGER_PATH)
+        session = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(session)
+        session.load_library()
+        sessions.append(session)
+        return session
+
+    yield open_session
+    for session in sessions:
+        # Like a crash: nothing is saved, the files are just let go of
+        session.wait_for_compaction()
+        session.close_journal()
+        for handle in (session.shared['reader'], session.lock['file']):
+            if handle is not None:
+                handle.close()
+
+
+def titles(session):
+    return sorted(item.title for item in session.my_library)
+
+
+def book(title):
+    return {'title': title, 'creator': 'Someone', 'year': '1999', 'format': 'Book'}
+
+
+def test_sessions_share_adds_saves_and_undos(open_session):
+    first = open_session()
+    second = open_session()
+
+    first_id = first.add_with_undo(book('Dune'))
+    second.check_for_changes()
+    assert titles(second) == ['Dune']
+
+    # The second session merges before adding, so ids can't clash
+    second_id = second.add_with_undo(book('Emma'))
+    assert second_id != first_id
+
+    first.save_library()
+    second.undo()
+    first.check_for_changes()
+    assert titles(first) == ['Dune']
+
+    first.add_with_undo(book('Ulysses'))
+    first.undo()
+    first.undo()
+    second.check_for_changes()
+    assert titles(first) == titles(second) == []
+
+    second.add_with_undo(book('Beloved'))
+    second.save_library()
+    first.check_for_changes()
+    assert titles(first) == ['Beloved']
+    assert titles(open_session()) == ['Beloved']
+
+
+def test_undo_of_an_item_another_session_deleted(open_session, capsys):
+    first = open_session()
+    second = open_session()
+
+    item_id = first.add_with_undo(book('Dune'))
+    second.check_for_changes()
+    second.delete_with_undo(item_id)
+    first.undo()
+    assert "another session has deleted" in capsys.readouterr().out
+    assert titles(first) == titles(second) == []
+
+
+def test_missed_journal_means_a_full_reload(open_session):
+    first = open_session()
+    second = open_session()
+
+    # Two saves between looks: the second session never sees the middle journal
+    first.add_with_undo(book('Dune'))
+    first.save_library()
+    first.add_with_undo(book('Emma'))
+    first.save_library()
+    first.add_with_undo(book('Ulysses'))
+
+    second.check_for_changes()
+    assert titles(second) == ['Dune', 'Emma', 'Ulysses']
+
+    # And it carries on following the journal after the reload
+    first.add_with_undo(book('Beloved'))
+    second.check_for_changes()
+    assert titles(second) == ['Beloved', 'Dune', 'Emma', 'Ulysses']
+
+
+def test_journal_replay_after_a_crash(open_session):
+    first = open_session()
+    dune = first.add_with_undo(book('Dune'))
+    emma = first.add_with_undo(book('Emma'))
+    first.update_with_undo(dune, {'rating': '4'})
+    first.delete_with_undo(emma)
+
+    # A crash in the middle of writing an entry leaves half a line
+    with open(first.JOURNAL_FILE, 'a') as file:
+        file.write('{"op": "add", "id": 9, "ite')
+
+    second = open_session()
+    assert titles(second) == ['Dune']
+    assert second.my_library.get(dune).rating == 4.0
+    assert second.my_library.has_changes()
+
+
+def test_crash_in_the_middle_of_compaction(open_session):
+    first = open_session()
+    first.add_with_undo(book('Dune'))
+    first.save_library()
+
+    # Two compactions that moved the journal aside but never wrote the CSV
+    first.add_with_undo(book('Emma'))
+    with first.library_lock():
+        first.rotate_journal()
+    first.add_with_undo(book('Ulysses'))
+    with first.library_lock():
+        first.rotate_journal()
+    first.add_with_undo(book('Beloved'))
+    assert os.path.exists(first.OLD_JOURNAL_FILE)
+
+    second = open_session()
+    assert titles(second) == ['Beloved', 'Dune', 'Emma', 'Ulysses']
+
+    second.save_library()
+    assert not os.path.exists(second.OLD_JOURNAL_FILE)
+    assert titles(open_session()) == ['Beloved', 'Dune', 'Emma', 'Ulysses']
+
+
+def test_background_compaction_keeps_every_change(open_session, monkeypatch):
+    first = open_session()
+    second = open_session()
+    monkeypatch.setattr(first, 'COMPACT_AFTER', 5)
+
+    for n in range(12):
+        first.add_with_undo(book(f'Book {n}'))
+        if n % 4 == 0:
+            second.add_with_undo(book(f'Other {n}'))
+    first.wait_for_compaction()
+
+    second.check_for_changes()
+    assert titles(second) == titles(first)
+    assert len(titles(open_session())) == 15
+
+
+def test_unreadable_year_survives_a_save(open_session):
+    first = open_session()
+    item_id = first.add_with_undo(book('Dune'))
+    first.update_with_undo(item_id, {'year': 'c. 1850'})
+    first.save_library()
+
+    with open(first.FILE_NAME, newline='') as file:
+        assert 'c. 1850' in file.read()
+    assert titles(open_session()) == ['Dune']
+
+    first.undo()
+    assert first.my_library.get(item_id).year == 1999
+    with open(first.JOURNAL_FILE) as file:
+        entries = [json.loads(line) for line in file]
+    assert entries[-1] == {'op': 'update', 'id': item_id, 'changes': {'year': 1999}}
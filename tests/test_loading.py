@@ -0,0 +1,49 @@
+import csv
+
+import pytest
+
+import dddd
+import dddd_bench
+
+
+@pytest.fixture
+def messy_csv(tmp_path):
+    # A catalog with lengths too big for the length arrays and a row that isn't UTF-8
+    filename = str(tmp_path / 'movies.csv')
+    dddd_bench.generate_catalog(filename, 300)
+    with open(filename, newline='', encoding='utf-8') as file:
+        rows = list(csv.reader(file))
+    rows[10][4] = '99999999999'
+    rows[20][4] = '-99999999999'
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+
+    with open(filename, 'rb') as file:
+        data = file.read().split(b'\n')
+    data[100] = data[100].replace(b',', b'\xff,', 1)
+    with open(filename, 'wb') as file:
+        file.write(b'\n'.join(data))
+    return filename
+
+
+@pytest.mark.parametrize('compact, workers', [(False, 1), (True, 1), (False, 2), (True, 2)])
+def test_bad_rows_only_lose_themselves(messy_csv, compact, workers):
+    bad_rows = []
+    if workers > 1:
+        movies = dddd.load_movies_parallel(messy_csv, workers, compact=compact, bad_rows=bad_rows)
+    else:
+        for movies, chunk in dddd.stream_movies(messy_csv, chunk_size=50, compact=compact, bad_rows=bad_rows):
+            pass
+
+    assert len(movies) == 299
+    assert [line for line, error in bad_rows] == [101]
+    assert movies[9]['length'] == 0
+    assert movies[19]['length'] == 0
+    assert dddd.movie_index['movies'] is movies
+    assert len(dddd.movie_index['lengths']) == sum(1 for movie in movies if movie['length'] > 0)
+
+
+def test_catalog_with_huge_lengths_loads(messy_csv):
+    assert len(dddd.load_catalog(messy_csv)) == 299
+    # and again from the snapshot
+    assert len(dddd.load_catalog(messy_csv)) == 299
@@ -0,0 +1,181 @@
+import csv
+import random
+
+import pytest
+
+import dddd
+import dddd_bench
+
+
+@pytest.fixture(scope='module')
+def catalog_csv(tmp_path_factory):
+    # A generated catalog with some lengths that are unknown (0, negative,
+    # blank or not a number), which no length filter should match
+    filename = str(tmp_path_factory.mktemp('catalog') / 'movies.csv')
+    dddd_bench.generate_catalog(filename, 600)
+    with open(filename, newline='', encoding='utf-8') as file:
+        rows = list(csv.reader(file))
+    for n, row in enumerate(rows[1:], 1):
+        for every, length in ((17, '0'), (23, '-5'), (31, ''), (41, 'abc')):
+            if n % every == 0:
+                row[4] = length
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+    return filename
+
+
+@pytest.fixture(scope='module')
+def reference(catalog_csv):
+    # Plain movie dicts with no index, so combine_filters checks every movie
+    return list(dddd.read_movies(catalog_csv))
+
+
+def load_list(filename):
+    return dddd.load_movies(filename)
+
+
+def load_compact(filename):
+    return dddd.load_movies(filename, compact=True)
+
+
+def load_parallel(filename):
+    return dddd.load_movies(filename, compact=True, workers=2)
+
+
+def load_snapshot(filename):
+    # Parse once to write the snapshot, then load from it
+    dddd.load_catalog(filename)
+    movies = dddd.load_catalog(filename)
+    assert dddd.load_snapshot(filename) is not None
+    return movies
+
+
+@pytest.fixture(params=[load_list, load_compact, load_parallel, load_snapshot])
+def indexed(request, catalog_csv):
+    movies = request.param(catalog_csv)
+    assert dddd.movie_index['movies'] is movies
+    return movies
+
+
+def linear(movies, filters):
+    # The filters applied one after another with the filter_by_* scans
+    results = movies
+    for filter_type, filter_value in filters:
+        if filter_type == 'genre':
+            results = dddd.filter_by_genre(results, filter_value)
+        elif filter_type == 'director':
+            results = dddd.filter_by_director(results, filter_value)
+        elif filter_type == 'actor':
+            results = dddd.filter_by_actor(results, filter_value)
+        elif filter_type == 'length':
+            results = dddd.filter_by_length(results, *filter_value)
+    return results
+
+
+def check(indexed, reference, filters):
+    expected = [dict(movie) for movie in linear(reference, filters)]
+    assert [dict(movie) for movie in dddd.combine_filters(indexed, filters)] == expected
+    return expected
+
+
+def random_text(rng, reference, filter_type):
+    # Part of a real value (sometimes shorter than an n-gram, sometimes with
+    # other case and spaces around it), or something nothing has
+    if rng.random() < 0.1:
+        return 'zzqx'
+    movie = rng.choice(reference)
+    if filter_type == 'genre':
+        values = movie['genres']
+    elif filter_type == 'director':
+        values = [movie['director']]
+    else:
+        values = movie['actors']
+    value = rng.choice(values) or 'a'
+    start = rng.randrange(len(value))
+    text = value[start:start + rng.randint(1, 8)]
+    if rng.random() < 0.3:
+        text = f"  {text.upper()} "
+    return text
+
+
+@pytest.mark.parametrize('filter_type', ['genre', 'director', 'actor'])
+def test_single_filters_match_a_scan(indexed, reference, filter_type):
+    rng = random.Random(filter_type)
+    for n in range(60):
+        check(indexed, reference, [(filter_type, random_text(rng, reference, filter_type))])
+    # An empty query matches every movie, same as a scan
+    check(indexed, reference, [(filter_type, '')])
+
+
+def test_ngrams_in_the_wrong_order_dont_match():
+    # 'abcxbcd' has every 3-gram of 'abcd' but doesn't contain it
+    movies = [
+        {'title': 'One', 'director': 'Abcxbcd', 'genres': ['abcxbcd'], 'rating': 'PG', 'length': 90, 'actors': ['abcxbcd']},
+        {'title': 'Two', 'director': 'Xabcdx', 'genres': ['xabcdx'], 'rating': 'PG', 'length': 95, 'actors': ['xabcdx']},
+    ]
+    index = dddd.build_index(movies)
+    for filter_type in ('genre', 'director', 'actor'):
+        assert dddd.search_index(index, [(filter_type, 'abcd')]) == [movies[1]]
+
+
+def random_length(rng):
+    # Open-ended and closed ranges, including bounds at or below 0
+    bounds = [None, None, -10, 0, 1, 60, 90, 120, 150, 400]
+    low, high = rng.choice(bounds), rng.choice(bounds)
+    if low is not None and high is not None and low > high and rng.random() < 0.8:
+        low, high = high, low
+    return (low, high)
+
+
+def random_filters(rng, reference, count):
+    filters = []
+    for n in range(count):
+        filter_type = rng.choice(['genre', 'director', 'actor', 'length'])
+        if filter_type == 'length':
+            filters.append(('length', random_length(rng)))
+        else:
+            filters.append((filter_type, random_text(rng, reference, filter_type)))
+    return filters
+
+
+def test_compound_filters_match_a_scan(indexed, reference):
+    rng = random.Random(2)
+    found = 0
+    for n in range(300):
+        filters = random_filters(rng, reference, rng.randint(2, 4))
+        found += bool(check(indexed, reference, filters))
+        # The planner picks the order, so the order given mustn't matter
+        assert dddd.combine_filters(indexed, filters[::-1]) == dddd.combine_filters(indexed, filters)
+    # Most of them should find something, or this isn't testing much
+    assert found > 100
+
+
+def test_plan_starts_with_the_most_selective_filter(indexed, reference):
+    rarest = min(dddd.movie_index['actor']['postings'].items(), key=lambda item: len(item[1]))[0]
+    plan = dddd.plan_filters(dddd.movie_index, [('genre', 'a'), ('length', (1, None)), ('actor', rarest)])
+    assert plan[0][1] == 'actor'
+    assert [estimate for estimate, *rest in plan] == sorted(estimate for estimate, *rest in plan)
+
+
+LENGTH_BOUNDS = [None, -10, 0, 1, 59, 60, 90, 120, 400]
+
+
+def test_length_ranges_match_a_scan(indexed, reference):
+    for low in LENGTH_BOUNDS:
+        for high in LENGTH_BOUNDS:
+            expected = [dict(movie) for movie in dddd.filter_by_length(reference, low, high)]
+            assert [dict(movie) for movie in dddd.filter_by_length(indexed, low, high)] == expected
+            check(indexed, reference, [('length', (low, high))])
+    # Unknown lengths (0 or less) never match, even with no bounds at all
+    assert len(dddd.filter_by_length(indexed)) == sum(1 for movie in reference if movie['length'] > 0)
+
+
+def test_length_index_while_streaming(catalog_csv):
+    # Each chunk's lengths wait in pending_lengths until the next length search
+    for movies, chunk in dddd.stream_movies(catalog_csv, chunk_size=70, compact=True):
+        so_far = [dict(movie) for movie in movies]
+        for low, high in ((None, 90), (90, None), (0, 120), (None, None)):
+            expected = dddd.filter_by_length(so_far, low, high)
+            assert [dict(movie) for movie in dddd.filter_by_length(movies, low, high)] == expected
+    assert dddd.movie_index['pending_lengths'] == []
+    assert list(dddd.movie_index['lengths']) == sorted(dddd.movie_index['lengths'])
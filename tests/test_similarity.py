@@ -0,0 +1,88 @@
+import math
+
+import pytest
+
+import dddd
+import dddd_bench
+
+
+def make_catalog(tmp_path, rows=400):
+    filename = str(tmp_path / 'movies.csv')
+    dddd_bench.generate_catalog(filename, rows)
+    return list(dddd.read_movies(filename))
+
+
+def cosine_scores(engine, movie_id):
+    # Straight cosine similarity of one movie against every other one
+    weights = engine['weights']
+    rows = engine['rows']
+    norms = engine['norms']
+    mine = set(rows[movie_id])
+    scores = {}
+    for other, columns in enumerate(rows):
+        shared = mine.intersection(columns)
+        if other != movie_id and shared:
+            scores[other] = sum(weights[c] ** 2 for c in shared) / (norms[movie_id] * norms[other])
+    return scores
+
+
+def check_neighbours(engine, movie_id, neighbours):
+    # The neighbours have to be the best `count` scores, best first
+    scores = cosine_scores(engine, movie_id)
+    expected = sorted(scores.values(), reverse=True)[:engine['count']]
+    got = [scores[other] for other in neighbours]
+    assert got == pytest.approx(expected, rel=1e-9)
+
+
+def test_pure_python_neighbours(monkeypatch, tmp_path):
+    monkeypatch.setattr(dddd, 'sparse', None)
+    engine = dddd.build_similarity(make_catalog(tmp_path))
+    assert engine['matrix'] is None
+    for movie_id in range(len(engine['rows'])):
+        check_neighbours(engine, movie_id, dddd.similar_movies(engine, movie_id))
+
+
+@pytest.mark.parametrize('precompute', [True, False])
+def test_scipy_matches_pure_python(monkeypatch, tmp_path, precompute):
+    pytest.importorskip('numpy')
+    pytest.importorskip('scipy.sparse')
+    movies = make_catalog(tmp_path)
+    fast = dddd.build_similarity(movies, precompute=precompute)
+    assert fast['matrix'] is not None
+
+    monkeypatch.setattr(dddd, 'sparse', None)
+    slow = dddd.build_similarity(movies)
+    for movie_id in range(len(movies)):
+        fast_ids = dddd.similar_movies(fast, movie_id)
+        slow_ids = dddd.similar_movies(slow, movie_id)
+        check_neighbours(fast, movie_id, fast_ids)
+        # Only a float-rounding tie can put different movies in the lists
+        fast_scores = cosine_scores(fast, movie_id)
+        assert [fast_scores[i] for i in fast_ids] == pytest.approx([fast_scores[i] for i in slow_ids], rel=1e-9)
+        values = sorted(set(fast_scores.values()))
+        if not any(math.isclose(a, b, rel_tol=1e-9) for a, b in zip(values, values[1:])):
+            assert fast_ids == slow_ids
+
+
+def test_engine_is_built_on_first_use(monkeypatch, capsys, tmp_path):
+    movies = make_catalog(tmp_path, 50)
+    built = []
+    real_build = dddd.build_similarity
+    monkeypatch.setattr(dddd, 'build_similarity', lambda movies: built.append(1) or real_build(movies))
+    monkeypatch.setattr(dddd, 'similarity_movies', movies)
+    monkeypatch.setattr(dddd, 'similarity_engine', None)
+
+    dddd.show_similar(movies[0])
+    dddd.show_similar(movies[1])
+    assert built == [1]
+    assert "More like this:" in capsys.readouterr().out
+
+
+def test_ties_at_the_cutoff_go_to_the_lower_ids():
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('scipy.sparse')
+    scores = np.array([[0.5, 0.2, 0.2, 0.9, 0.2, 0.0, 0.2, -1.0]] * 3)
+    assert dddd.top_neighbours(scores, 3) == [[3, 0, 1]] * 3
+    assert dddd.top_neighbours(scores, 6) == [[3, 0, 1, 2, 4, 6]] * 3
+    # Nothing scoring 0 or less is ever a neighbour
+    assert dddd.top_neighbours(scores, 8) == [[3, 0, 1, 2, 4, 6]] * 3
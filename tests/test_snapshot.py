@@ -0,0 +1,71 @@
+import os
+
+import dddd
+import dddd_bench
+
+
+def make_csv(tmp_path, rows, name='movies.csv'):
+    filename = str(tmp_path / name)
+    dddd_bench.generate_catalog(filename, rows)
+    return filename
+
+
+def same_index(loaded, built):
+    for field in ('genre', 'director', 'actor'):
+        postings = {term: list(ids) for term, ids in loaded[field]['postings'].items()}
+        assert postings == {term: list(ids) for term, ids in built[field]['postings'].items()}
+        assert loaded[field]['ngrams'] == built[field]['ngrams']
+    assert list(loaded['lengths']) == list(built['lengths'])
+    assert list(loaded['length_ids']) == list(built['length_ids'])
+    assert loaded['pending_lengths'] == []
+
+
+def test_snapshot_round_trip(tmp_path):
+    filename = make_csv(tmp_path, 500)
+    parsed = dddd.load_catalog(filename)
+    assert os.path.exists(dddd.snapshot_path(filename))
+
+    movies, index = dddd.load_snapshot(filename)
+    assert index['movies'] is movies
+    assert [dict(movie) for movie in movies] == [dict(movie) for movie in parsed]
+    same_index(index, dddd.build_index(movies))
+
+    # A snapshot load makes the loaded index the one searches use
+    assert dddd.load_catalog(filename) is not parsed
+    assert dddd.movie_index['movies'] is not parsed
+
+
+def test_changed_csv_skips_the_snapshot(tmp_path):
+    filename = make_csv(tmp_path, 100)
+    dddd.load_catalog(filename)
+    dddd_bench.generate_catalog(filename, 200)
+    assert dddd.load_snapshot(filename) is None
+    assert len(dddd.load_catalog(filename)) == 200
+
+
+def test_csv_rewritten_while_parsing(tmp_path, monkeypatch):
+    filename = make_csv(tmp_path, 100)
+    real_load_movies = dddd.load_movies
+
+    def load_then_rewrite(*args, **kwargs):
+        movies = real_load_movies(*args, **kwargs)
+        dddd_bench.generate_catalog(filename, 500)
+        return movies
+
+    monkeypatch.setattr(dddd, 'load_movies', load_then_rewrite)
+    assert len(dddd.load_catalog(filename)) == 100
+    monkeypatch.undo()
+
+    # The 100 movies must not be passed off as the new file
+    assert dddd.load_snapshot(filename) is None
+    assert len(dddd.load_catalog(filename)) == 500
+
+
+def test_broken_snapshot_is_rebuilt(tmp_path):
+    filename = make_csv(tmp_path, 100)
+    dddd.load_catalog(filename)
+    with open(dddd.snapshot_path(filename), 'r+b') as file:
+        file.truncate(200)
+    assert dddd.load_snapshot(filename) is None
+    assert len(dddd.load_catalog(filename)) == 100
+    assert dddd.load_snapshot(filename) is not None